@@ -0,0 +1,419 @@
+import argparse
+import gzip
+import json
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, any_, bindparam, delete, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Connection
+
+from database import engine
+from models import DataCollector
+
+
+# GPS fixes consumed by add_trip (is_used) are never read again. Whole
+# days older than DATA_RETENTION_DAYS are written to gzipped NDJSON files,
+# one directory per day and one file per user, and then deleted in
+# batches of DATA_ARCHIVE_BATCH_SIZE. Unused fixes are never touched.
+#
+# Run from the project root, e.g. daily from cron:
+#   python -m Tools.dataRetention archive
+#   python -m Tools.dataRetention partition      # optional, once
+#   python -m Tools.dataRetention add-partitions # if partitioned, monthly
+DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", "30"))
+DATA_ARCHIVE_DIR = os.getenv("DATA_ARCHIVE_DIR", "archive/data_collector")
+DATA_ARCHIVE_BATCH_SIZE = int(os.getenv("DATA_ARCHIVE_BATCH_SIZE", "5000"))
+DATA_PARTITION_MONTHS_AHEAD = int(os.getenv("DATA_PARTITION_MONTHS_AHEAD", "3"))
+
+ARCHIVE_COLUMNS = (
+    DataCollector.id,
+    DataCollector.user_id,
+    DataCollector.latitude,
+    DataCollector.longitude,
+    DataCollector.speed,
+    DataCollector.timestamp,
+)
+
+
+def retention_cutoff(older_than_days: Optional[int] = None) -> datetime:
+    """Start of the oldest day that is kept; everything before is archived."""
+    if older_than_days is None:
+        older_than_days = DATA_RETENTION_DAYS
+    return datetime.combine(date.today() - timedelta(days=older_than_days), time.min)
+
+
+def archive_consumed_points(
+    older_than_days: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """Archive and delete consumed fixes from days before the cutoff.
+
+    A day is deleted only after all of its files are on disk. File names
+    carry the first and last point id they contain, so re-running after an
+    interruption rewrites the same files instead of adding new ones.
+
+    With the partitioned layout (see ``partition_data_collector``), months
+    that end before the cutoff and hold no unused fixes are dropped as a
+    whole after archiving instead of being deleted row by row.
+    """
+    cutoff = retention_cutoff(older_than_days)
+    archive_dir = archive_dir or DATA_ARCHIVE_DIR
+    batch_size = batch_size or DATA_ARCHIVE_BATCH_SIZE
+    summary = {"days": 0, "files": 0, "points": 0, "partitions_dropped": 0}
+
+    with engine.connect() as conn:
+        droppable = [
+            (name, lower, upper)
+            for name, lower, upper in _partitions(conn)
+            if upper is not None and upper <= cutoff and not _has_unused(conn, name)
+        ]
+        stmt = (
+            select(func.date_trunc("day", DataCollector.timestamp).label("day"))
+            .where(
+                DataCollector.is_used.is_(True),
+                DataCollector.timestamp < cutoff,
+            )
+            .distinct()
+            .order_by("day")
+        )
+        days = conn.execute(stmt).scalars().all()
+        conn.commit()
+
+        # Ids archived from partitions that will be dropped rather than
+        # deleted from.
+        deferred: Dict[str, List[int]] = {}
+
+        for day in days:
+            files, point_ids = _archive_day(conn, day, archive_dir)
+            summary["days"] += 1
+            summary["files"] += files
+            summary["points"] += len(point_ids)
+            partition = next(
+                (name for name, lower, upper in droppable if lower <= day < upper),
+                None,
+            )
+            if partition is None:
+                _delete_points(conn, point_ids, batch_size)
+            else:
+                deferred.setdefault(partition, []).extend(point_ids)
+
+        for name, point_ids in deferred.items():
+            # A late upload may have added unused fixes since the check, so
+            # check again with writes blocked until the drop commits. The
+            # parent is locked before the partition, in the order inserts
+            # routed through it take their locks.
+            conn.execute(
+                text(
+                    f'LOCK TABLE ONLY data_collector, "{name}" '
+                    "IN ACCESS EXCLUSIVE MODE"
+                )
+            )
+            if _has_unused(conn, name):
+                conn.commit()
+                _delete_points(conn, point_ids, batch_size)
+                continue
+            conn.execute(text(f'DROP TABLE "{name}"'))
+            conn.commit()
+            summary["partitions_dropped"] += 1
+
+    return summary
+
+
+def _archive_day(
+    conn: Connection, day: datetime, archive_dir: str
+) -> Tuple[int, List[int]]:
+    stmt = (
+        select(*ARCHIVE_COLUMNS)
+        .where(
+            DataCollector.is_used.is_(True),
+            DataCollector.timestamp >= day,
+            DataCollector.timestamp < day + timedelta(days=1),
+        )
+        .order_by(DataCollector.user_id, DataCollector.timestamp, DataCollector.id)
+        .execution_options(yield_per=DATA_ARCHIVE_BATCH_SIZE)
+    )
+    day_dir = os.path.join(archive_dir, day.strftime("%Y-%m-%d"))
+    os.makedirs(day_dir, exist_ok=True)
+
+    point_ids: List[int] = []
+    files = 0
+    writer = None
+    for row in conn.execute(stmt):
+        if writer is None or writer.user_id != row.user_id:
+            if writer is not None:
+                writer.close()
+            writer = _UserDayWriter(day_dir, row.user_id)
+            files += 1
+        writer.write(row)
+        point_ids.append(row.id)
+    if writer is not None:
+        writer.close()
+    conn.commit()
+    return files, point_ids
+
+
+class _UserDayWriter:
+    """Writes one user's fixes for one day to ``user_<id>_<first>-<last>``."""
+
+    def __init__(self, day_dir: str, user_id: Optional[int]):
+        self.day_dir = day_dir
+        self.user_id = user_id
+        self.first_id: Optional[int] = None
+        self.last_id: Optional[int] = None
+        self._tmp_path = os.path.join(day_dir, f".user_{user_id}.ndjson.gz.tmp")
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+
+    def write(self, row) -> None:
+        if self.first_id is None or row.id < self.first_id:
+            self.first_id = row.id
+        if self.last_id is None or row.id > self.last_id:
+            self.last_id = row.id
+        record = dict(row._mapping)
+        record["timestamp"] = record["timestamp"].isoformat()
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+        path = os.path.join(
+            self.day_dir,
+            f"user_{self.user_id}_{self.first_id}-{self.last_id}.ndjson.gz",
+        )
+        os.replace(self._tmp_path, path)
+
+
+def _delete_points(conn: Connection, point_ids: List[int], batch_size: int) -> None:
+    # Short transactions keep row locks and WAL bursts small while the API
+    # keeps writing new fixes.
+    stmt = delete(DataCollector).where(
+        DataCollector.id == any_(bindparam("point_ids", type_=ARRAY(Integer)))
+    )
+    for start in range(0, len(point_ids), batch_size):
+        conn.execute(stmt, {"point_ids": point_ids[start : start + batch_size]})
+        conn.commit()
+
+
+# Optional layout: data_collector as a table partitioned by month on
+# timestamp. Old months can then be dropped instead of deleted row by row,
+# and the unused-points query only touches recent partitions. The primary
+# key becomes (id, timestamp), as Postgres requires the partition key in
+# it; ids still come from the same sequence.
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'data_collector'::regclass)"
+        )
+    ).scalar()
+
+
+def _partitions(conn: Connection) -> List[Tuple[str, datetime, Optional[datetime]]]:
+    """(name, lower, upper) of each monthly partition, oldest first."""
+    if not _is_partitioned(conn):
+        return []
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'data_collector'::regclass "
+            "AND c.relname ~ '^data_collector_[0-9]{6}$' ORDER BY c.relname"
+        )
+    ).scalars()
+    partitions = []
+    for name in rows:
+        lower = datetime.strptime(name[-6:], "%Y%m")
+        partitions.append((name, lower, _next_month(lower)))
+    return partitions
+
+
+def _has_unused(conn: Connection, partition: str) -> bool:
+    return conn.execute(
+        text(
+            f'SELECT EXISTS (SELECT 1 FROM "{partition}" '
+            "WHERE is_used IS NOT TRUE)"
+        )
+    ).scalar()
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _months(start: datetime, end: datetime) -> Iterable[datetime]:
+    month = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end:
+        yield month
+        month = _next_month(month)
+
+
+def _create_partition(conn: Connection, month: datetime) -> None:
+    name = f"data_collector_{month:%Y%m}"
+    conn.execute(
+        text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF data_collector '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') "
+            f"TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+    )
+
+
+def add_partitions(months_ahead: Optional[int] = None) -> None:
+    """Create monthly partitions up to ``months_ahead`` months from now.
+
+    Fixes outside every monthly partition land in data_collector_default,
+    so a missed run never rejects writes; run this well ahead of time.
+    """
+    if months_ahead is None:
+        months_ahead = DATA_PARTITION_MONTHS_AHEAD
+    now = datetime.now()
+    end = now
+    for _ in range(months_ahead):
+        end = _next_month(end)
+    with engine.begin() as conn:
+        if not _is_partitioned(conn):
+            raise RuntimeError("data_collector is not partitioned")
+        for month in _months(now, end):
+            _create_partition(conn, month)
+
+
+def _archive_untimed_points(conn: Connection, archive_dir: str) -> int:
+    """Write fixes without a timestamp to one file; returns how many.
+
+    They cannot be copied into a table partitioned on timestamp. The file
+    is named after the first and last id it holds and is left alone when it
+    already exists, so re-running after a failed partitioning (which rolls
+    back and keeps the rows) does not archive them twice.
+    """
+    count, first_id, last_id = conn.execute(
+        select(
+            func.count(), func.min(DataCollector.id), func.max(DataCollector.id)
+        ).where(DataCollector.timestamp.is_(None))
+    ).one()
+    if not count:
+        return 0
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"untimed_{first_id}-{last_id}.ndjson.gz")
+    if os.path.exists(path):
+        return count
+    stmt = (
+        select(*ARCHIVE_COLUMNS, DataCollector.is_used)
+        .where(DataCollector.timestamp.is_(None))
+        .order_by(DataCollector.id)
+        .execution_options(yield_per=DATA_ARCHIVE_BATCH_SIZE)
+    )
+    tmp_path = os.path.join(archive_dir, ".untimed.ndjson.gz.tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+        for row in conn.execute(stmt):
+            file.write(json.dumps(dict(row._mapping), separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+    return count
+
+
+def partition_data_collector(
+    months_ahead: Optional[int] = None, archive_dir: Optional[str] = None
+) -> Dict[str, int]:
+    """Rebuild data_collector as a monthly range-partitioned table.
+
+    Runs in one transaction and copies every row, so it holds an exclusive
+    lock on the table for the duration; run it in a maintenance window.
+    Fixes without a timestamp are archived (see
+    ``_archive_untimed_points``) instead of copied.
+    """
+    if months_ahead is None:
+        months_ahead = DATA_PARTITION_MONTHS_AHEAD
+    archive_dir = archive_dir or DATA_ARCHIVE_DIR
+    summary = {"points": 0, "untimed_points_archived": 0}
+    with engine.begin() as conn:
+        if _is_partitioned(conn):
+            return summary
+        conn.execute(text("LOCK TABLE data_collector IN ACCESS EXCLUSIVE MODE"))
+        oldest = conn.execute(select(func.min(DataCollector.timestamp))).scalar()
+        now = datetime.now()
+        end = now
+        for _ in range(months_ahead):
+            end = _next_month(end)
+
+        summary["untimed_points_archived"] = _archive_untimed_points(
+            conn, archive_dir
+        )
+        conn.execute(text("ALTER TABLE data_collector RENAME TO data_collector_old"))
+        conn.execute(
+            text(
+                "CREATE TABLE data_collector (LIKE data_collector_old "
+                "INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+            )
+        )
+        conn.execute(
+            text("ALTER SEQUENCE data_collector_id_seq OWNED BY data_collector.id")
+        )
+        for month in _months(oldest or now, end):
+            _create_partition(conn, month)
+        conn.execute(
+            text("CREATE TABLE data_collector_default PARTITION OF data_collector DEFAULT")
+        )
+        summary["points"] = conn.execute(
+            text(
+                "INSERT INTO data_collector "
+                "SELECT * FROM data_collector_old WHERE timestamp IS NOT NULL"
+            )
+        ).rowcount
+        conn.execute(text("DROP TABLE data_collector_old"))
+
+        conn.execute(text("ALTER TABLE data_collector ALTER COLUMN timestamp SET NOT NULL"))
+        conn.execute(
+            text(
+                "ALTER TABLE data_collector ADD CONSTRAINT data_collector_pkey "
+                "PRIMARY KEY (id, timestamp)"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE data_collector ADD CONSTRAINT data_collector_user_id_fkey "
+                'FOREIGN KEY (user_id) REFERENCES "user" (id)'
+            )
+        )
+        conn.execute(text("CREATE INDEX ix_data_collector_id ON data_collector (id)"))
+        conn.execute(
+            text(
+                "CREATE INDEX ix_data_collector_user_id_timestamp_unused "
+                "ON data_collector (user_id, timestamp) WHERE is_used IS false"
+            )
+        )
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m Tools.dataRetention",
+        description="Archive consumed GPS fixes and manage data_collector partitions.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive = commands.add_parser("archive", help="archive and delete consumed fixes")
+    archive.add_argument("--older-than-days", type=int, default=None)
+    archive.add_argument("--archive-dir", default=None)
+    archive.add_argument("--batch-size", type=int, default=None)
+    for name in ("partition", "add-partitions"):
+        command = commands.add_parser(name)
+        command.add_argument("--months-ahead", type=int, default=None)
+    partition = commands.choices["partition"]
+    partition.add_argument("--archive-dir", default=None)
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        print(
+            archive_consumed_points(
+                args.older_than_days, args.archive_dir, args.batch_size
+            )
+        )
+    elif args.command == "partition":
+        print(partition_data_collector(args.months_ahead, args.archive_dir))
+    else:
+        add_partitions(args.months_ahead)
+
+
+if __name__ == "__main__":
+    main()
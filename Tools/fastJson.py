@@ -0,0 +1,35 @@
+import json
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Large read endpoints build plain dicts from projected columns and encode
+# them here in one pass, instead of constructing a Pydantic model per row
+# that FastAPI would then validate and walk again with jsonable_encoder.
+# The JSON is equivalent to what JSONResponse sends for the same content,
+# not byte-identical: orjson writes 1e-05 as 0.00001 and NaN as null where
+# the stdlib raises. Without orjson the stdlib fallback uses JSONResponse's
+# own settings.
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """Equivalent JSON to JSONResponse for content of plain JSON types."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,147 @@
+import math
+import os
+from typing import List, Tuple
+
+from sqlalchemy import func
+
+
+# A geocell is a geohash kept as an integer: longitude and latitude are
+# each quantised to CELL_BITS bits and interleaved (longitude first, as in
+# geohash), so nearby points share a prefix and every prefix is one
+# contiguous range of values. A plain B-tree on the column then answers
+# "everything inside these cells" with a few range scans. At 26 bits per
+# axis a cell is about 0.6 m by 0.3 m at the equator.
+#
+# migrations/versions/8c4d2a6f0e19_complaint_geocell.py computes the same
+# value in SQL for the backfill; keep the two in step.
+
+CELL_BITS = 26
+CELL_SCALE = 1 << CELL_BITS
+EARTH_RADIUS_M = 6371008.8
+# A bounding box is covered by at most this many cells of one level.
+# Fewer means coarser cells and more rows filtered out after the scan.
+MAX_COVER_CELLS = int(os.getenv("GEOCELL_MAX_COVER_CELLS", "32"))
+
+
+def _quantise(value: float, low: float, span: float) -> int:
+    return min(max(int((value - low) / span * CELL_SCALE), 0), CELL_SCALE - 1)
+
+
+def _spread(value: int) -> int:
+    """Move the low 32 bits of ``value`` to the even bit positions."""
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+
+def _compact(value: int) -> int:
+    """Inverse of _spread: gather the even bits of ``value``."""
+    value &= 0x5555555555555555
+    value = (value | (value >> 1)) & 0x3333333333333333
+    value = (value | (value >> 2)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value >> 4)) & 0x00FF00FF00FF00FF
+    value = (value | (value >> 8)) & 0x0000FFFF0000FFFF
+    value = (value | (value >> 16)) & 0x00000000FFFFFFFF
+    return value
+
+
+def _interleave(x: int, y: int) -> int:
+    return (_spread(x) << 1) | _spread(y)
+
+
+def geocell(latitude: float, longitude: float) -> int:
+    """Cell of a point at full resolution; out-of-range values are clamped."""
+    return _interleave(
+        _quantise(longitude, -180.0, 360.0), _quantise(latitude, -90.0, 180.0)
+    )
+
+
+def zone_of(latitude: float, longitude: float, bits: int) -> int:
+    """The geocell prefix of ``bits`` bits per axis containing a point."""
+    return geocell(latitude, longitude) >> (2 * (CELL_BITS - bits))
+
+
+def zone_bounds(zone: int, bits: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a zone made by zone_of."""
+    x, y = _compact(zone >> 1), _compact(zone)
+    width, height = 360.0 / (1 << bits), 180.0 / (1 << bits)
+    south, west = -90.0 + y * height, -180.0 + x * width
+    return south, west, south + height, west + width
+
+
+def _cover(
+    south: float, west: float, north: float, east: float
+) -> List[Tuple[int, int]]:
+    x0, x1 = _quantise(west, -180.0, 360.0), _quantise(east, -180.0, 360.0)
+    y0, y1 = _quantise(south, -90.0, 180.0), _quantise(north, -90.0, 180.0)
+    shift = 0
+    while ((x1 >> shift) - (x0 >> shift) + 1) * (
+        (y1 >> shift) - (y0 >> shift) + 1
+    ) > MAX_COVER_CELLS:
+        shift += 1
+    width = 1 << (2 * shift)
+    starts = sorted(
+        _interleave(x, y) << (2 * shift)
+        for x in range(x0 >> shift, (x1 >> shift) + 1)
+        for y in range(y0 >> shift, (y1 >> shift) + 1)
+    )
+    return [(start, start + width - 1) for start in starts]
+
+
+def cell_ranges(
+    south: float, west: float, north: float, east: float
+) -> List[Tuple[int, int]]:
+    """Inclusive geocell ranges covering a bounding box, merged and sorted.
+
+    A box with west > east crosses the antimeridian. The cover may reach
+    outside the box, so callers still filter on the coordinates.
+    """
+    if west > east:
+        ranges = _cover(south, west, north, 180.0) + _cover(south, -180.0, north, east)
+    else:
+        ranges = _cover(south, west, north, east)
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def radius_bbox(
+    latitude: float, longitude: float, radius_m: float
+) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a box containing the circle."""
+    delta_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = latitude - delta_lat, latitude + delta_lat
+    if south <= -90.0 or north >= 90.0:
+        # The circle contains a pole, so every longitude is in range.
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    ratio = math.sin(radius_m / EARTH_RADIUS_M) / math.cos(math.radians(latitude))
+    if ratio >= 1.0:
+        return south, -180.0, north, 180.0
+    delta_lon = math.degrees(math.asin(ratio))
+    west, east = longitude - delta_lon, longitude + delta_lon
+    # Wrap into [-180, 180]; west > east then means crossing the antimeridian.
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def distance_m(latitude_column, longitude_column, latitude: float, longitude: float):
+    """SQL great-circle distance in metres from a column pair to a point."""
+    a = func.power(
+        func.sin(func.radians(latitude_column - latitude) / 2), 2
+    ) + func.cos(func.radians(latitude)) * func.cos(
+        func.radians(latitude_column)
+    ) * func.power(
+        func.sin(func.radians(longitude_column - longitude) / 2), 2
+    )
+    return 2 * EARTH_RADIUS_M * func.asin(func.sqrt(func.least(a, 1.0)))
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import math
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, delete, func, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import (
+    Complaint,
+    HeatmapBin,
+    HeatmapWatermark,
+    LocationPoints,
+    Trip,
+    TripMode,
+)
+from Tools.cache import AsyncSingleFlight, TTLCache
+
+
+# Heatmaps are served as Web Mercator tiles (z/x/y) of counts per bin.
+# Points are counted once into heatmap_bin per tile of HEATMAP_BASE_ZOOM,
+# and a tile at zoom z is HEATMAP_TILE_BINS bins across, summed from the
+# base bins it covers. Bins finer than the base zoom are never produced.
+#
+# Counting is incremental: every layer has a watermark, the highest source
+# row id already counted, and a refresh only aggregates rows above it.
+# Tile reads never refresh; they serve what has been counted so far. A
+# background task started with the app refreshes every
+# HEATMAP_REFRESH_SECONDS (0 disables it, e.g. when
+# `python -m Tools.heatmap refresh` runs from cron instead). Tiles are
+# cached in-process and dropped when a refresh or a deletion touches them.
+# Other workers pick up such changes when their own entries expire.
+HEATMAP_BASE_ZOOM = int(os.getenv("HEATMAP_BASE_ZOOM", "17"))
+HEATMAP_TILE_BINS = int(os.getenv("HEATMAP_TILE_BINS", "64"))
+HEATMAP_REFRESH_SECONDS = float(os.getenv("HEATMAP_REFRESH_SECONDS", "30"))
+HEATMAP_CACHE_TTL = float(os.getenv("HEATMAP_CACHE_TTL", "300"))
+HEATMAP_CACHE_SIZE = int(os.getenv("HEATMAP_CACHE_SIZE", "4096"))
+
+LAYERS = ("complaints", "origins", "destinations")
+# Bins per tile side as a shift; HEATMAP_TILE_BINS is rounded down to a
+# power of two.
+TILE_BIN_BITS = max(HEATMAP_TILE_BINS, 1).bit_length() - 1
+# Web Mercator stops here; points further north or south go to edge tiles.
+MAX_LATITUDE = 85.0511287798066
+# Refreshes take this advisory lock exclusively to read the new high ids;
+# writers of source rows hold it shared until they commit (see
+# lock_heatmap_sources), so no row below a high id can appear later.
+HEATMAP_LOCK_ID = 0x68656174
+# Past this many changed bins a refresh drops the whole tile cache.
+INVALIDATE_BINS_LIMIT = 1000
+
+tile_cache = TTLCache(maxsize=HEATMAP_CACHE_SIZE, ttl=HEATMAP_CACHE_TTL)
+_tile_flight = AsyncSingleFlight()
+_refresh_flight = AsyncSingleFlight()
+
+
+def _tile_x(longitude, zoom: int):
+    n = 1 << zoom
+    x = func.floor((longitude + 180.0) / 360.0 * n)
+    return func.least(func.greatest(x, 0), n - 1).cast(Integer)
+
+
+def _tile_y(latitude, zoom: int):
+    n = 1 << zoom
+    phi = func.radians(func.least(func.greatest(latitude, -MAX_LATITUDE), MAX_LATITUDE))
+    y = func.floor(
+        (1.0 - func.ln(func.tan(phi) + 1.0 / func.cos(phi)) / math.pi) / 2.0 * n
+    )
+    return func.least(func.greatest(y, 0), n - 1).cast(Integer)
+
+
+def _points(layer: str):
+    """Source rows of a layer as (id, key, x, y) at the base zoom."""
+    if layer == "complaints":
+        return select(
+            Complaint.id.label("id"),
+            func.coalesce(Complaint.category, "").label("key"),
+            _tile_x(Complaint.location_lon, HEATMAP_BASE_ZOOM).label("x"),
+            _tile_y(Complaint.location_lat, HEATMAP_BASE_ZOOM).label("y"),
+        )
+    location_id = (
+        Trip.origin_location_id if layer == "origins" else Trip.destination_location_id
+    )
+    # Trips of deleted journeys lose their journey_id and leave the map.
+    return (
+        select(
+            Trip.id.label("id"),
+            func.coalesce(TripMode.mode_name, "").label("key"),
+            _tile_x(LocationPoints.longitude, HEATMAP_BASE_ZOOM).label("x"),
+            _tile_y(LocationPoints.latitude, HEATMAP_BASE_ZOOM).label("y"),
+        )
+        .join(LocationPoints, LocationPoints.id == location_id)
+        .outerjoin(TripMode, TripMode.id == Trip.mode_id)
+        .where(Trip.journey_id.isnot(None))
+    )
+
+
+def _source_id(layer: str):
+    return Complaint.id if layer == "complaints" else Trip.id
+
+
+def _binned(layer: str, *criteria):
+    points = _points(layer).where(*criteria).subquery()
+    return select(
+        points.c.key, points.c.x, points.c.y, func.count().label("count")
+    ).group_by(points.c.key, points.c.x, points.c.y)
+
+
+async def lock_heatmap_sources(db: AsyncSession) -> None:
+    """Hold back heatmap refreshes until this transaction ends.
+
+    Call it before inserting complaints or trips, so a refresh cannot move
+    a watermark past ids this transaction has taken but not committed.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock_shared(HEATMAP_LOCK_ID)))
+
+
+async def _lock_watermarks(db: AsyncSession, layers: Iterable[str]) -> Dict[str, int]:
+    stmt = (
+        pg_insert(HeatmapWatermark)
+        .values([{"layer": layer, "last_id": 0} for layer in layers])
+        .on_conflict_do_nothing(index_elements=[HeatmapWatermark.layer])
+    )
+    await db.execute(stmt)
+    # Always locked in layer order, by refreshes and deletions alike.
+    stmt = (
+        select(HeatmapWatermark.layer, HeatmapWatermark.last_id)
+        .where(HeatmapWatermark.layer.in_(list(layers)))
+        .order_by(HeatmapWatermark.layer)
+        .with_for_update()
+    )
+    return dict((await db.execute(stmt)).all())
+
+
+async def _high_ids(
+    db: AsyncSession, wait: bool = True
+) -> Optional[Dict[str, Optional[int]]]:
+    # Once the exclusive lock is granted, every transaction that took ids
+    # up to these has committed. It is released by the caller's commit.
+    # Waiting for it queues new writers behind the refresh, so background
+    # refreshes only try it and return None when writers hold it.
+    if wait:
+        await db.execute(select(func.pg_advisory_xact_lock(HEATMAP_LOCK_ID)))
+    elif not (
+        await db.execute(select(func.pg_try_advisory_xact_lock(HEATMAP_LOCK_ID)))
+    ).scalar():
+        return None
+    return {
+        layer: (await db.execute(select(func.max(_source_id(layer))))).scalar()
+        for layer in LAYERS
+    }
+
+
+async def _refresh(
+    db: AsyncSession, rebuild: bool = False, wait: bool = True
+) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+    """Count new source rows into heatmap_bin; returns the changed bins.
+
+    Commits once after reading the high ids, so writers are only held
+    back for that; the caller commits the counts. Without ``wait``,
+    returns None instead of waiting for writers to finish.
+    """
+    highs = await _high_ids(db, wait)
+    await db.commit()
+    if highs is None:
+        return None
+
+    watermarks = await _lock_watermarks(db, LAYERS)
+    if rebuild:
+        await db.execute(delete(HeatmapBin))
+        await db.execute(update(HeatmapWatermark).values(last_id=0))
+        watermarks = {layer: 0 for layer in watermarks}
+    changed = {}
+    for layer, last_id in watermarks.items():
+        high = highs[layer]
+        if high is None or high <= last_id:
+            continue
+        source_id = _source_id(layer)
+        binned = _binned(layer, source_id > last_id, source_id <= high).subquery()
+        stmt = pg_insert(HeatmapBin).from_select(
+            ["layer", "key", "x", "y", "count"],
+            select(literal(layer), binned.c.key, binned.c.x, binned.c.y, binned.c.count),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                HeatmapBin.layer, HeatmapBin.x, HeatmapBin.y, HeatmapBin.key
+            ],
+            set_={"count": HeatmapBin.count + stmt.excluded.count},
+        ).returning(HeatmapBin.x, HeatmapBin.y)
+        changed[layer] = (await db.execute(stmt)).all()
+        await db.execute(
+            update(HeatmapWatermark)
+            .where(HeatmapWatermark.layer == layer)
+            .values(last_id=high, refreshed_at=datetime.now())
+        )
+    return changed
+
+
+def _invalidate_tiles(changed: Dict[str, List[Tuple[int, int]]]) -> None:
+    if sum(len(bins) for bins in changed.values()) > INVALIDATE_BINS_LIMIT:
+        tile_cache.invalidate()
+        return
+    for layer, bins in changed.items():
+        for zoom in range(HEATMAP_BASE_ZOOM + 1):
+            shift = HEATMAP_BASE_ZOOM - zoom
+            for x, y in {(x >> shift, y >> shift) for x, y in bins}:
+                tile_cache.invalidate((layer, zoom, x, y))
+
+
+def invalidate_heatmap() -> None:
+    tile_cache.invalidate()
+
+
+async def refresh_heatmap(wait: bool = True) -> bool:
+    """Count rows added since the last refresh; concurrent callers share it.
+
+    Without ``wait`` it gives up, returning False, while source rows are
+    being written.
+    """
+
+    async def run():
+        # The shared refresh uses its own session, see AsyncSingleFlight.
+        async with AsyncSessionLocal() as db:
+            changed = await _refresh(db, wait=wait)
+            await db.commit()
+        if changed is None:
+            return False
+        _invalidate_tiles(changed)
+        return True
+
+    return await _refresh_flight.do(("refresh", wait), run)
+
+
+async def _refresher() -> None:
+    while True:
+        try:
+            await refresh_heatmap(wait=False)
+        except Exception as e:
+            print("Error:", e)
+        await asyncio.sleep(HEATMAP_REFRESH_SECONDS)
+
+
+def start_heatmap_refresher() -> Optional[asyncio.Task]:
+    if HEATMAP_REFRESH_SECONDS <= 0:
+        return None
+    return asyncio.create_task(_refresher())
+
+
+async def stop_heatmap_refresher(task: Optional[asyncio.Task]) -> None:
+    if task is None:
+        return
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def rebuild_heatmap() -> None:
+    """Recount every layer from scratch, e.g. after bulk deletes."""
+    async with AsyncSessionLocal() as db:
+        await _refresh(db, rebuild=True)
+        await db.commit()
+    invalidate_heatmap()
+
+
+async def forget_journey(db: AsyncSession, journey_id: int) -> None:
+    """Uncount the trips of a journey that is being deleted through ``db``.
+
+    Only trips below the watermarks were counted; the rest will be skipped
+    by the next refresh once the journey is gone. The caller commits and
+    then calls invalidate_heatmap().
+    """
+    watermarks = await _lock_watermarks(db, ("destinations", "origins"))
+    for layer, last_id in watermarks.items():
+        binned = _binned(
+            layer, Trip.journey_id == journey_id, Trip.id <= last_id
+        ).subquery()
+        stmt = (
+            update(HeatmapBin)
+            .where(
+                HeatmapBin.layer == layer,
+                HeatmapBin.key == binned.c.key,
+                HeatmapBin.x == binned.c.x,
+                HeatmapBin.y == binned.c.y,
+            )
+            .values(count=HeatmapBin.count - binned.c.count)
+            .returning(HeatmapBin.key, HeatmapBin.x, HeatmapBin.y, HeatmapBin.count)
+        )
+        empty = [
+            (key, x, y) for key, x, y, count in await db.execute(stmt) if count <= 0
+        ]
+        if empty:
+            await db.execute(
+                delete(HeatmapBin).where(
+                    HeatmapBin.layer == layer,
+                    tuple_(HeatmapBin.key, HeatmapBin.x, HeatmapBin.y).in_(empty),
+                )
+            )
+
+
+async def _compute_tile(
+    layer: str, zoom: int, x: int, y: int, generation: int
+) -> Dict:
+    bin_zoom = min(zoom + TILE_BIN_BITS, HEATMAP_BASE_ZOOM)
+    shift = HEATMAP_BASE_ZOOM - bin_zoom
+    span = 1 << (HEATMAP_BASE_ZOOM - zoom)
+    # Bin coordinates are relative to the tile's first bin.
+    first_x, first_y = x << (bin_zoom - zoom), y << (bin_zoom - zoom)
+    bins = (
+        select(
+            HeatmapBin.key,
+            (HeatmapBin.x.op(">>")(shift) - first_x).label("i"),
+            (HeatmapBin.y.op(">>")(shift) - first_y).label("j"),
+            HeatmapBin.count,
+        )
+        .where(
+            HeatmapBin.layer == layer,
+            HeatmapBin.x.between(x * span, (x + 1) * span - 1),
+            HeatmapBin.y.between(y * span, (y + 1) * span - 1),
+        )
+        .subquery()
+    )
+    stmt = (
+        select(bins.c.key, bins.c.i, bins.c.j, func.sum(bins.c.count))
+        .group_by(bins.c.key, bins.c.i, bins.c.j)
+        .order_by(bins.c.key, bins.c.j, bins.c.i)
+    )
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).all()
+
+    by_key: Dict[str, list] = {}
+    for key, i, j, count in rows:
+        if count > 0:
+            by_key.setdefault(key, []).append([i, j, int(count)])
+    tile = {
+        "layer": layer,
+        "z": zoom,
+        "x": x,
+        "y": y,
+        "bin_zoom": bin_zoom,
+        "total": sum(count for bins in by_key.values() for _, _, count in bins),
+        "bins": by_key,
+    }
+    tile_cache.set((layer, zoom, x, y), tile, generation)
+    return tile
+
+
+async def heatmap_tile(
+    layer: str, zoom: int, x: int, y: int, key: Optional[str] = None
+) -> Dict:
+    """Counts per bin of one tile, optionally of one category or mode.
+
+    ``bins`` maps each key to [i, j, count] triples, where (i, j) is the
+    bin's offset within the tile at ``bin_zoom``.
+    """
+    cache_key = (layer, zoom, x, y)
+    tile = tile_cache.get(cache_key)
+    if tile is None:
+        # A tile read before a refresh or deletion touched it is served
+        # but not cached, see TTLCache.
+        generation = tile_cache.generation
+        tile = await _tile_flight.do(
+            (cache_key, generation),
+            lambda: _compute_tile(layer, zoom, x, y, generation),
+        )
+    if key is None:
+        return tile
+    bins = tile["bins"].get(key, [])
+    return {
+        **tile,
+        "total": sum(count for _, _, count in bins),
+        "bins": {key: bins} if bins else {},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m Tools.heatmap",
+        description="Bring the heatmap bins up to date.",
+    )
+    parser.add_argument(
+        "command",
+        choices=("refresh", "rebuild"),
+        help="count new rows, or recount everything",
+    )
+    args = parser.parse_args()
+    if args.command == "refresh":
+        asyncio.run(refresh_heatmap())
+    else:
+        asyncio.run(rebuild_heatmap())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,239 @@
 import json
 import math
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 import requests
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from baseModel import TripRequestBase
-from models import DataCollector
+from database import SessionLocal, engine
+from models import DataCollector, GeocodeCache
+from Tools.cache import SingleFlight, TTLCache
+from Tools.metrics import (
+    function_seconds,
+    outbound_request_seconds,
+    outbound_retries,
+    timed,
+    trip_classification_seconds,
+)
+from Tools.rateLimit import PostgresRateLimiter
+from Tools.trajectory import simplify_trace
+from Tools.tripSegmentation import segment_trips
 
 load_dotenv()
 
 USER_AGENT = os.getenv("USER_AGENT", "MyApp/1.0 (email@example.com)")
 DEFAULT_TIMEOUT = 8.0
-genai.configure(api_key=os.getenv("GEMINI_API"))
+# "local" runs the in-process segmentation engine, "llm" asks Gemini.
+TRIP_CLASSIFIER = os.getenv("TRIP_CLASSIFIER", "local").lower()
+TRIP_CLASSIFIERS = ("local", "llm")
+# Classifiers that get the simplified trace instead of every raw fix. The
+# LLM prompt grows with the number of fixes; the local engine smooths over
+# consecutive fixes and is cheap enough to keep them all.
+TRACE_SIMPLIFY_CLASSIFIERS = {
+    name.strip().lower()
+    for name in os.getenv("TRACE_SIMPLIFY_CLASSIFIERS", "llm").split(",")
+    if name.strip()
+}
+# GEMINI_API_ENDPOINT points the client at another host, such as the
+# benchmark stub; it is then spoken to over REST.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(
+        api_key=os.getenv("GEMINI_API"),
+        transport="rest",
+        client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+    )
+else:
+    genai.configure(api_key=os.getenv("GEMINI_API"))
+
+# External lookups for one request run concurrently on this shared pool.
+LOOKUP_MAX_WORKERS = int(os.getenv("LOOKUP_MAX_WORKERS", "16"))
+lookup_executor = ThreadPoolExecutor(
+    max_workers=LOOKUP_MAX_WORKERS, thread_name_prefix="lookup"
+)
+
+# Nominatim allows 1 request/s per application. NOMINATIM_RATE_LIMIT is
+# enforced through a row of the rate_limit table, so the budget holds across
+# every worker process and host sharing the database.
+NOMINATIM_URL = os.getenv(
+    "NOMINATIM_URL", "https://nominatim.openstreetmap.org"
+).rstrip("/")
+NOMINATIM_RATE_LIMIT = float(os.getenv("NOMINATIM_RATE_LIMIT", "1.0"))
+nominatim_limiter = PostgresRateLimiter(
+    engine, name="nominatim", rate=NOMINATIM_RATE_LIMIT
+)
+# How long a lookup may queue for a token. A journey with many uncached
+# cells needs about one second per cell; a lookup that still gets no token
+# leaves the name NULL rather than storing a placeholder.
+NOMINATIM_MAX_WAIT_SECONDS = float(os.getenv("NOMINATIM_MAX_WAIT_SECONDS", "120"))
+
+# Reverse-geocoding results are cached per cell of lat/lon rounded to this
+# many decimals (3 ~ 110 m). Entries live in-process for GEOCODE_CACHE_TTL
+# seconds and in the geocode_cache table for GEOCODE_CACHE_DB_TTL seconds.
+GEOCODE_CACHE_PRECISION = int(os.getenv("GEOCODE_CACHE_PRECISION", "3"))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", "86400"))
+GEOCODE_CACHE_DB_TTL = float(os.getenv("GEOCODE_CACHE_DB_TTL", str(30 * 86400)))
+
+geocode_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+_geocode_flight = SingleFlight()
+geocode_counters = {"db_hits": 0, "db_misses": 0, "remote_lookups": 0}
+# Lookups run on lookup_executor threads; += on a dict item is not atomic.
+_geocode_counters_lock = threading.Lock()
+
+# Route distances are memoized per profile and origin/destination snapped to
+# ROUTE_CACHE_PRECISION decimals (4 ~ 11 m).
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org").rstrip("/")
+OSRM_MAX_LEGS = int(os.getenv("OSRM_MAX_LEGS", "50"))
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", "4"))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "50000"))
+ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", str(7 * 86400)))
+
+route_cache = TTLCache(maxsize=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL)
+
 
+def geocode_cell(latitude: float, longitude: float) -> str:
+    p = GEOCODE_CACHE_PRECISION
+    return f"{round(latitude, p):.{p}f},{round(longitude, p):.{p}f}"
 
-def get_location_name(latitude: float, longitude: float) -> str:
 
+def _count_geocode(counter: Optional[str] = None, amount: int = 1) -> Dict[str, int]:
+    """Add ``amount`` to ``counter`` if given; returns a snapshot of the counters."""
+    with _geocode_counters_lock:
+        if counter is not None:
+            geocode_counters[counter] += amount
+        return dict(geocode_counters)
+
+
+def geocode_cache_stats() -> Dict[str, int]:
+    return {
+        **geocode_cache.stats(),
+        **_count_geocode(),
+        "deduplicated": _geocode_flight.shared,
+    }
+
+
+@timed(function_seconds, "get_location_name")
+def get_location_name(latitude: float, longitude: float) -> Optional[str]:
+    """Name of the area around a point from the in-process cache or Nominatim.
+
+    Concurrent lookups for the same cell share a single resolution. None
+    means the name could not be looked up this time. The geocode_cache
+    table is read and written by resolve_location_names and its callers.
+    """
+    cell = geocode_cell(latitude, longitude)
+    name = geocode_cache.get(cell)
+    if name is not None:
+        return name
+    return _geocode_flight.do(
+        cell, lambda: _resolve_geocode_cell(cell, latitude, longitude)
+    )
+
+
+def resolve_location_names(
+    points: List[Tuple[float, float]],
+) -> Tuple[List[Optional[str]], Dict[str, str]]:
+    """Names for many (latitude, longitude) points, looked up concurrently.
+
+    Points in the same cache cell are resolved once: from the in-process
+    cache, then with one query on geocode_cache, then from Nominatim.
+    Also returns the cells that were looked up remotely, for the caller
+    to store with geocode_cache_upsert() in its own transaction.
+    """
+    cells: Dict[str, Tuple[float, float]] = {}
+    for latitude, longitude in points:
+        cells.setdefault(geocode_cell(latitude, longitude), (latitude, longitude))
+    names: Dict[str, Optional[str]] = {}
+    for cell in cells:
+        name = geocode_cache.get(cell)
+        if name is not None:
+            names[cell] = name
+    missing = [cell for cell in cells if cell not in names]
+    if missing:
+        stored = _load_geocode_cells(missing)
+        for cell, name in stored.items():
+            geocode_cache.set(cell, name)
+        names.update(stored)
+
+    futures = {
+        cell: lookup_executor.submit(get_location_name, *cells[cell])
+        for cell in cells
+        if cell not in names
+    }
+    fetched: Dict[str, str] = {}
+    for cell, future in futures.items():
+        names[cell] = future.result()
+        if names[cell] is not None:
+            fetched[cell] = names[cell]
+    return [names[geocode_cell(lat, lon)] for lat, lon in points], fetched
+
+
+def _resolve_geocode_cell(
+    cell: str, latitude: float, longitude: float
+) -> Optional[str]:
+    _count_geocode("remote_lookups")
+    name = _nominatim_reverse(latitude, longitude)
+    # Failed lookups are not cached so the next request retries them.
+    if name is not None:
+        geocode_cache.set(cell, name)
+    return name
+
+
+def _load_geocode_cells(cells: List[str]) -> Dict[str, str]:
     try:
-        url = "https://nominatim.openstreetmap.org/reverse"
+        with SessionLocal() as db:
+            stmt = select(GeocodeCache.cell, GeocodeCache.location_name).where(
+                GeocodeCache.cell.in_(cells),
+                GeocodeCache.updated_at
+                >= datetime.now() - timedelta(seconds=GEOCODE_CACHE_DB_TTL),
+            )
+            names = dict(db.execute(stmt).all())
+    except Exception:
+        # The persistent tier is best effort; the in-process cache still works.
+        names = {}
+    _count_geocode("db_hits", len(names))
+    _count_geocode("db_misses", len(cells) - len(names))
+    return names
+
+
+def geocode_cache_upsert(names: Dict[str, str]):
+    """One INSERT ... ON CONFLICT storing ``names`` in geocode_cache.
+
+    Rows are written in cell order so concurrent writers lock them in the
+    same order and cannot deadlock.
+    """
+    now = datetime.now()
+    stmt = pg_insert(GeocodeCache).values(
+        [
+            {"cell": cell, "location_name": name, "updated_at": now}
+            for cell, name in sorted(names.items())
+        ]
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[GeocodeCache.cell],
+        set_={
+            "location_name": stmt.excluded.location_name,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+@timed(function_seconds, "_nominatim_reverse")
+def _nominatim_reverse(latitude: float, longitude: float) -> Optional[str]:
+    """Area name from Nominatim, or None when the lookup failed."""
+    try:
+        if not nominatim_limiter.acquire(timeout=NOMINATIM_MAX_WAIT_SECONDS):
+            return None
+        url = f"{NOMINATIM_URL}/reverse"
         params = {
             "format": "json",
             "lat": str(latitude),
@@ -35,7 +248,7 @@ def get_location_name(latitude: float, longitude: float) -> str:
         )
 
         if resp.status_code != 200:
-            return "Unknown"
+            return None
 
         data = resp.json()
         addr = data.get("address", {}) or {}
@@ -55,9 +268,9 @@ def get_location_name(latitude: float, longitude: float) -> str:
             parts = [p.strip() for p in data["display_name"].split(",")]
             return ", ".join(parts[:3]) if parts else data["display_name"]
 
-        return "Unknown"
+        return None
     except Exception:
-        return "Unknown"
+        return None
 
 
 def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -72,40 +285,117 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+def _route_key(
+    profile: str,
+    originLatitude: float,
+    originLongitude: float,
+    destLatitude: float,
+    destLongitude: float,
+) -> tuple:
+    p = ROUTE_CACHE_PRECISION
+    return (
+        profile,
+        round(originLatitude, p),
+        round(originLongitude, p),
+        round(destLatitude, p),
+        round(destLongitude, p),
+    )
+
+
+def _osrm_route_legs(
+    waypoints: List[Tuple[float, float]], profile: str
+) -> Optional[List[float]]:
+    """Distance in km of every leg of a route through ``waypoints``.
+
+    Returns None when OSRM fails or the response has the wrong shape.
+    """
+    # Note: OSRM expects lon,lat ordering for coordinates
+    coordinates = ";".join(f"{lon},{lat}" for lat, lon in waypoints)
+    url = f"{OSRM_URL}/route/v1/{profile}/{coordinates}"
+    # By default OSRM will not turn around at a waypoint, so each leg would
+    # depend on the direction the previous connecting leg arrived from.
+    # continue_straight=false lets every leg start as a request of its own.
+    params = {
+        "overview": "false",
+        "alternatives": "false",
+        "steps": "false",
+        "continue_straight": "false",
+    }
+    headers = {"User-Agent": USER_AGENT}
+    resp = _retry_get(
+        url, params=params, headers=headers, timeout=DEFAULT_TIMEOUT, max_attempts=3
+    )
+    if not resp or resp.status_code != 200:
+        return None
+    routes = resp.json().get("routes")
+    if not routes or not isinstance(routes, list):
+        return None
+    legs = routes[0].get("legs") or []
+    if len(legs) != len(waypoints) - 1:
+        return None
+    distances = [leg.get("distance") for leg in legs]
+    if any(d is None for d in distances):
+        return None
+    return [float(d) / 1000.0 for d in distances]
+
+
+@timed(function_seconds, "distance_travelled")
 def distance_travelled(
     originLatitude: float,
     originLongitude: float,
     destLatitude: float,
     destLongitude: float,
+    profile: str = "driving",
 ) -> float:
+    return distance_travelled_batch(
+        [(originLatitude, originLongitude, destLatitude, destLongitude)],
+        profile=profile,
+    )[0]
 
-    try:
-        # Note: OSRM expects lon,lat ordering for coordinates
-        url = (
-            "http://router.project-osrm.org/route/v1/driving/"
-            f"{originLongitude},{originLatitude};{destLongitude},{destLatitude}"
-        )
-        params = {"overview": "false", "alternatives": "false", "steps": "false"}
-        headers = {"User-Agent": USER_AGENT}
-        resp = _retry_get(
-            url, params=params, headers=headers, timeout=DEFAULT_TIMEOUT, max_attempts=3
-        )
-        if resp and resp.status_code == 200:
-            data = resp.json()
-            routes = data.get("routes")
-            if routes and isinstance(routes, list) and len(routes) > 0:
-                distance_meters = routes[0].get("distance")
-                if distance_meters is not None:
-                    return float(distance_meters) / 1000.0
-        # fallback to haversine if OSRM failed or returned nothing meaningful
-        return haversine_km(
-            originLatitude, originLongitude, destLatitude, destLongitude
-        )
-    except Exception:
-        # safe fallback
-        return haversine_km(
-            originLatitude, originLongitude, destLatitude, destLongitude
-        )
+
+@timed(function_seconds, "distance_travelled_batch")
+def distance_travelled_batch(
+    legs: List[Tuple[float, float, float, float]], profile: str = "driving"
+) -> List[float]:
+    """Route distance in km for each (origin lat, origin lon, dest lat, dest lon).
+
+    Cached legs are answered from route_cache. The rest are resolved with a
+    single multi-waypoint OSRM request (origin_1, dest_1, origin_2, ...) per
+    chunk of OSRM_MAX_LEGS, keeping only the origin->dest legs. Legs OSRM
+    cannot route fall back to haversine and are not cached.
+    """
+    results: List[Optional[float]] = [None] * len(legs)
+    missing = []
+    for index, leg in enumerate(legs):
+        cached = route_cache.get(_route_key(profile, *leg))
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.append(index)
+
+    for chunk_start in range(0, len(missing), OSRM_MAX_LEGS):
+        chunk = missing[chunk_start : chunk_start + OSRM_MAX_LEGS]
+        waypoints = []
+        for index in chunk:
+            originLatitude, originLongitude, destLatitude, destLongitude = legs[index]
+            waypoints.append((originLatitude, originLongitude))
+            waypoints.append((destLatitude, destLongitude))
+        try:
+            distances = _osrm_route_legs(waypoints, profile)
+        except Exception:
+            distances = None
+        if distances is None:
+            continue
+        for offset, index in enumerate(chunk):
+            # Odd legs connect one trip's destination to the next trip's
+            # origin and are not part of any trip.
+            results[index] = distances[2 * offset]
+            route_cache.set(_route_key(profile, *legs[index]), results[index])
+
+    return [
+        result if result is not None else haversine_km(*leg)
+        for result, leg in zip(results, legs)
+    ]
 
 
 def _retry_get(
@@ -118,20 +408,47 @@ def _retry_get(
 ) -> Optional[requests.Response]:
     attempt = 0
     backoff = backoff_base
+    host = urlsplit(url).hostname or ""
     while attempt < max_attempts:
+        started = time.perf_counter()
+        outcome = "error"
         try:
             resp = requests.get(url, params=params, headers=headers, timeout=timeout)
+            outcome = str(resp.status_code)
             if resp.status_code == 200 or (400 <= resp.status_code < 500):
                 return resp
         except requests.RequestException:
             pass
+        finally:
+            outbound_request_seconds.observe(
+                time.perf_counter() - started, host, outcome
+            )
+        outbound_retries.inc(host)
         attempt += 1
         time.sleep(backoff)
         backoff *= 2
     return None
 
 
-def travel_mode_interprter(tripsData: List[DataCollector]) -> dict:
+def travel_mode_interprter(
+    tripsData: List[DataCollector], classifier: Optional[str] = None
+) -> List[dict]:
+    """Segment a trace into trips using the configured classifier.
+
+    ``classifier`` overrides the TRIP_CLASSIFIER setting for one call.
+    """
+    classifier = (classifier or TRIP_CLASSIFIER).lower()
+    if classifier not in TRIP_CLASSIFIERS:
+        raise ValueError(f"Unknown trip classifier: {classifier}")
+    with trip_classification_seconds.time(classifier):
+        if classifier in TRACE_SIMPLIFY_CLASSIFIERS:
+            tripsData = simplify_trace(tripsData)
+        if classifier == "llm":
+            return _llm_travel_mode_interprter(tripsData)
+        return segment_trips(tripsData)
+
+
+def _llm_travel_mode_interprter(tripsData: List[DataCollector]) -> List[dict]:
 
     system_prompt = """
 You are a transport mode classifier.
@@ -0,0 +1,298 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+
+# A small in-process metrics registry rendered in the Prometheus text
+# format on /metrics. Each metric keeps one lock and a dict of label
+# values, so recording a sample costs a dict lookup and a few additions.
+# Values are per process; Prometheus should scrape every worker.
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for labelvalues, value in self._values.items():
+                lines.append(
+                    f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+                )
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        # Per-bucket (not cumulative) counts, with a final +Inf slot.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        return _Timer(self, labelvalues)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            snapshot = [
+                (labelvalues, list(counts), total)
+                for labelvalues, (counts, total) in self._values.items()
+            ]
+        for labelvalues, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} "
+                    f"{cumulative}"
+                )
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+
+def timed(histogram: Histogram, *labelvalues: str) -> Callable:
+    """Decorator recording every call's duration, including failed ones."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(*labelvalues):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # Called at scrape time for values that live elsewhere, such as
+        # pool occupancy; each returns (name, kind, documentation, samples)
+        # where kind is "counter" or "gauge" and samples are (labels dict,
+        # value) pairs.
+        self._collectors: List[Callable[[], Iterable]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_labels(list(labels), list(labels.values()))} "
+                        f"{_number(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, until the response body is sent.",
+    ("method", "route", "status"),
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being served.",
+    ("method", "route"),
+)
+function_seconds = Histogram(
+    "function_duration_seconds",
+    "Duration of instrumented calls such as geocoding, routing and classification.",
+    ("function",),
+)
+trip_classification_seconds = Histogram(
+    "trip_classification_duration_seconds",
+    "Duration of travel_mode_interprter by classifier.",
+    ("classifier",),
+)
+outbound_request_seconds = Histogram(
+    "outbound_request_duration_seconds",
+    "Duration of each _retry_get attempt by host and outcome.",
+    ("host", "outcome"),
+)
+outbound_retries = Counter(
+    "outbound_request_retries_total",
+    "Failed _retry_get attempts that were retried or gave up.",
+    ("host",),
+)
+db_statement_seconds = Histogram(
+    "db_statement_duration_seconds",
+    "Time Postgres took to execute a statement, by engine and verb.",
+    ("engine", "statement"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Time every statement executed by a (sync) engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("metrics_started", None)
+        if started is None:
+            return
+        verb = statement.lstrip()[:6].upper()
+        if verb not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            verb = "OTHER"
+        db_statement_seconds.observe(time.perf_counter() - started, name, verb)
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding the request latency and in-flight metrics.
+
+    Requests are labelled with the matched route's path template (e.g.
+    /get/trip/job/{job_id}), so label cardinality stays bounded; paths
+    that match no route share the "unmatched" label.
+    """
+
+    def __init__(self, app, routes: Optional[Sequence] = None):
+        self.app = app
+        self.routes = routes if routes is not None else []
+
+    def _route(self, scope) -> str:
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+            if match == Match.PARTIAL and partial is None:
+                partial = getattr(route, "path", None)
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method, route)
+            http_request_seconds.observe(
+                time.perf_counter() - started, method, route, str(status_code)
+            )
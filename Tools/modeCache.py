@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import TripMode
+
+
+# A lookup for an unknown mode reloads the table at most this often, so a
+# mode added directly in the database is picked up without a restart.
+MODE_CACHE_MISS_RELOAD_SECONDS = float(
+    os.getenv("MODE_CACHE_MISS_RELOAD_SECONDS", "60")
+)
+# Every process reloads the table once its copy is this old, so a rename
+# (or /update/trip_modes/refresh, which only reaches one worker) shows up in
+# all of them within MODE_CACHE_TTL seconds.
+MODE_CACHE_TTL = float(os.getenv("MODE_CACHE_TTL", "300"))
+
+
+class TripModeCache:
+    """Read-mostly in-process copy of the trip_mode table.
+
+    Both directions (name -> id, id -> name) are swapped in atomically on
+    every load, so readers never see a half-built mapping. Mode names are
+    upper case, as stored by add_trip.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, int] = {}
+        self._by_id: Dict[int, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    async def load(self, db: AsyncSession) -> Dict[str, int]:
+        rows = (await db.execute(select(TripMode.id, TripMode.mode_name))).all()
+        by_name = {name.upper(): id for id, name in rows if name}
+        by_id = {id: name for id, name in rows}
+        with self._lock:
+            self._by_name, self._by_id = by_name, by_id
+            self._loaded_at = time.monotonic()
+        return by_name
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    async def _ensure_loaded(self, db: AsyncSession, missed: bool = False) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            await self.load(db)
+            return
+        age = time.monotonic() - loaded_at
+        if age >= MODE_CACHE_TTL or (
+            missed and age >= MODE_CACHE_MISS_RELOAD_SECONDS
+        ):
+            await self.load(db)
+
+    async def id_for(self, db: AsyncSession, mode_name: str) -> Optional[int]:
+        await self._ensure_loaded(db)
+        mode_name = mode_name.upper()
+        mode_id = self._by_name.get(mode_name)
+        if mode_id is None:
+            await self._ensure_loaded(db, missed=True)
+            mode_id = self._by_name.get(mode_name)
+        return mode_id
+
+    async def ids_for(
+        self, db: AsyncSession, mode_names: Iterable[str]
+    ) -> Dict[str, int]:
+        """Ids of several modes; unknown names are left out."""
+        ids = {}
+        for mode_name in mode_names:
+            mode_id = await self.id_for(db, mode_name)
+            if mode_id is not None:
+                ids[mode_name.upper()] = mode_id
+        return ids
+
+    async def name_for(self, db: AsyncSession, mode_id: int) -> Optional[str]:
+        await self._ensure_loaded(db)
+        name = self._by_id.get(mode_id)
+        if name is None:
+            await self._ensure_loaded(db, missed=True)
+            name = self._by_id.get(mode_id)
+        return name
+
+    async def names(self, db: AsyncSession) -> Dict[int, str]:
+        """Every mode as id -> name."""
+        await self._ensure_loaded(db)
+        return dict(self._by_id)
+
+
+trip_modes = TripModeCache()
@@ -0,0 +1,71 @@
+import os
+from typing import Dict
+
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal
+from models import Journey, Trip
+from Tools.cache import AsyncSingleFlight, TTLCache
+from Tools.modeCache import trip_modes
+
+
+# The modal split is cached for MODE_SHARE_CACHE_TTL seconds and dropped
+# whenever this process creates, verifies or deletes trips. Other workers
+# pick up such changes when their own entry expires.
+MODE_SHARE_CACHE_TTL = float(os.getenv("MODE_SHARE_CACHE_TTL", "60"))
+
+mode_share_cache = TTLCache(maxsize=1, ttl=MODE_SHARE_CACHE_TTL)
+_mode_share_flight = AsyncSingleFlight()
+
+
+def invalidate_mode_share() -> None:
+    mode_share_cache.invalidate()
+
+
+async def mode_share() -> Dict:
+    """Trip counts and percentages per mode plus the verified share.
+
+    Computed with one GROUP BY over trip; concurrent misses share it.
+    """
+    summary = mode_share_cache.get("summary")
+    if summary is not None:
+        return summary
+    # Callers arriving after an invalidation start a new computation
+    # instead of sharing one that may predate the change.
+    generation = mode_share_cache.generation
+    return await _mode_share_flight.do(
+        ("summary", generation), lambda: _compute_mode_share(generation)
+    )
+
+
+async def _compute_mode_share(generation: int) -> Dict:
+    stmt = (
+        select(
+            Trip.mode_id,
+            func.count(),
+            func.count().filter(Journey.is_verified_by_user.is_(True)),
+        )
+        .outerjoin(Journey, Journey.id == Trip.journey_id)
+        .group_by(Trip.mode_id)
+    )
+    # The shared computation uses its own session, see AsyncSingleFlight.
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).all()
+        mode_names = await trip_modes.names(db)
+    total = sum(count for _, count, _ in rows)
+    verified = sum(verified_count for _, _, verified_count in rows)
+    counts = {mode_id: count for mode_id, count, _ in rows}
+
+    def percentage(count: int) -> float:
+        return (count / total) * 100 if total else 0.0
+
+    summary = {
+        "total_trips": total,
+        "modes": {
+            name: percentage(counts.get(mode_id, 0))
+            for mode_id, name in mode_names.items()
+        },
+        "verified_trips": percentage(verified),
+    }
+    mode_share_cache.set("summary", summary, generation)
+    return summary
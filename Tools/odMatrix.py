@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database import AsyncSessionLocal
+from models import LocationPoints, ODFlow, Trip
+from Tools.cache import AsyncSingleFlight, TTLCache
+from Tools.fastJson import dumps
+from Tools.geoCell import zone_of
+from Tools.modeCache import trip_modes
+
+
+# Origin-destination flows are kept in od_flow per (origin zone,
+# destination zone, mode, hour of the start time): trip count and summed
+# distance. Zones are geocell prefixes of OD_ZONE_BITS bits per axis
+# (Tools/geoCell.py; 14 bits is about 1.2 km x 2.4 km near the equator).
+# build_journey adds the flows of new trips and deleting a journey
+# subtracts its trips, both in the transaction that changes the trips.
+# After changing OD_ZONE_BITS run `python -m Tools.odMatrix rebuild`.
+#
+# The full matrix is served from an encoded copy cached for
+# OD_MATRIX_CACHE_TTL seconds and dropped whenever this process creates or
+# deletes trips. Other workers pick up such changes when it expires.
+OD_ZONE_BITS = int(os.getenv("OD_ZONE_BITS", "14"))
+OD_MATRIX_CACHE_TTL = float(os.getenv("OD_MATRIX_CACHE_TTL", "60"))
+OD_REBUILD_BATCH_SIZE = 10000
+# asyncpg binds at most 32767 parameters per statement and every od_flow
+# row takes one per column, so upserts are split into chunks of this size.
+OD_UPSERT_MAX_ROWS = 32767 // len(ODFlow.__table__.columns)
+
+OD_COLUMNS = (
+    "origin_zone",
+    "destination_zone",
+    "mode",
+    "hour",
+    "trips",
+    "distance_km",
+)
+
+od_matrix_cache = TTLCache(maxsize=1, ttl=OD_MATRIX_CACHE_TTL)
+_od_matrix_flight = AsyncSingleFlight()
+
+# (origin zone, destination zone, mode id, hour) -> [trips, distance]
+Flows = Dict[Tuple[int, int, int, int], List]
+
+
+def _trip_ends_stmt():
+    """Origin, destination, mode, start time and distance of trips."""
+    origin = aliased(LocationPoints)
+    destination = aliased(LocationPoints)
+    return (
+        select(
+            origin.latitude,
+            origin.longitude,
+            destination.latitude,
+            destination.longitude,
+            Trip.mode_id,
+            Trip.start_time,
+            Trip.distance_travelled,
+        )
+        .join(origin, origin.id == Trip.origin_location_id)
+        .join(destination, destination.id == Trip.destination_location_id)
+    )
+
+
+def aggregate_flows(trips: Iterable[tuple], flows: Optional[Flows] = None) -> Flows:
+    """Add rows shaped like _trip_ends_stmt() to ``flows``.
+
+    Trips without a mode have no place in the matrix and are skipped.
+    """
+    if flows is None:
+        flows = defaultdict(lambda: [0, 0.0])
+    for o_lat, o_lon, d_lat, d_lon, mode_id, start_time, distance in trips:
+        if mode_id is None:
+            continue
+        flow = flows[
+            (
+                zone_of(o_lat, o_lon, OD_ZONE_BITS),
+                zone_of(d_lat, d_lon, OD_ZONE_BITS),
+                mode_id,
+                start_time.hour,
+            )
+        ]
+        flow[0] += 1
+        flow[1] += distance or 0.0
+    return flows
+
+
+async def _add_flows(db: AsyncSession, flows: Flows) -> None:
+    # Rows are written in key order so concurrent writers lock them in the
+    # same order and cannot deadlock.
+    rows = [
+        {
+            "origin_zone": origin_zone,
+            "destination_zone": destination_zone,
+            "mode_id": mode_id,
+            "hour": hour,
+            "trip_count": count,
+            "distance_km": distance,
+        }
+        for (origin_zone, destination_zone, mode_id, hour), (
+            count,
+            distance,
+        ) in sorted(flows.items())
+    ]
+    for start in range(0, len(rows), OD_UPSERT_MAX_ROWS):
+        stmt = pg_insert(ODFlow).values(rows[start : start + OD_UPSERT_MAX_ROWS])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                ODFlow.origin_zone,
+                ODFlow.destination_zone,
+                ODFlow.mode_id,
+                ODFlow.hour,
+            ],
+            set_={
+                "trip_count": ODFlow.trip_count + stmt.excluded.trip_count,
+                "distance_km": ODFlow.distance_km + stmt.excluded.distance_km,
+            },
+        )
+        await db.execute(stmt)
+
+
+async def add_trip_flows(db: AsyncSession, trips: Iterable[tuple]) -> None:
+    """Count new trips, given as _trip_ends_stmt() rows, through ``db``."""
+    await _add_flows(db, aggregate_flows(trips))
+
+
+async def remove_journey_flows(db: AsyncSession, journey_id: int) -> None:
+    """Uncount the trips of a journey that is being deleted through ``db``."""
+    stmt = _trip_ends_stmt().where(Trip.journey_id == journey_id)
+    flows = aggregate_flows(await db.execute(stmt))
+    if not flows:
+        return
+    keys = sorted(flows)
+    table = ODFlow.__table__
+    stmt = (
+        update(table)
+        .where(
+            table.c.origin_zone == bindparam("b_origin_zone"),
+            table.c.destination_zone == bindparam("b_destination_zone"),
+            table.c.mode_id == bindparam("b_mode_id"),
+            table.c.hour == bindparam("b_hour"),
+        )
+        .values(
+            trip_count=table.c.trip_count - bindparam("b_trip_count"),
+            distance_km=table.c.distance_km - bindparam("b_distance_km"),
+        )
+    )
+    await db.execute(
+        stmt,
+        [
+            {
+                "b_origin_zone": key[0],
+                "b_destination_zone": key[1],
+                "b_mode_id": key[2],
+                "b_hour": key[3],
+                "b_trip_count": flows[key][0],
+                "b_distance_km": flows[key][1],
+            }
+            for key in keys
+        ],
+    )
+    await db.execute(
+        delete(ODFlow).where(
+            tuple_(
+                ODFlow.origin_zone, ODFlow.destination_zone, ODFlow.mode_id, ODFlow.hour
+            ).in_(keys),
+            ODFlow.trip_count <= 0,
+        )
+    )
+
+
+def invalidate_od_matrix() -> None:
+    od_matrix_cache.invalidate()
+
+
+def _matrix(rows, mode_names: Dict[int, str]) -> Dict:
+    return {
+        "zone_bits": OD_ZONE_BITS,
+        "columns": list(OD_COLUMNS),
+        "rows": [
+            [
+                origin_zone,
+                destination_zone,
+                mode_names.get(mode_id),
+                hour,
+                count,
+                round(distance, 3),
+            ]
+            for origin_zone, destination_zone, mode_id, hour, count, distance in rows
+        ],
+    }
+
+
+def _flows_stmt():
+    return select(
+        ODFlow.origin_zone,
+        ODFlow.destination_zone,
+        ODFlow.mode_id,
+        ODFlow.hour,
+        ODFlow.trip_count,
+        ODFlow.distance_km,
+    ).order_by(
+        ODFlow.origin_zone, ODFlow.destination_zone, ODFlow.mode_id, ODFlow.hour
+    )
+
+
+async def od_matrix() -> bytes:
+    """The whole matrix as encoded JSON; concurrent misses share one query."""
+    body = od_matrix_cache.get("matrix")
+    if body is not None:
+        return body
+    # Callers arriving after an invalidation start a new computation
+    # instead of sharing one that may predate the change.
+    generation = od_matrix_cache.generation
+    return await _od_matrix_flight.do(
+        ("matrix", generation), lambda: _compute_od_matrix(generation)
+    )
+
+
+async def _compute_od_matrix(generation: int) -> bytes:
+    # The shared computation uses its own session, see AsyncSingleFlight.
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(_flows_stmt())).all()
+        mode_names = await trip_modes.names(db)
+    body = dumps(_matrix(rows, mode_names))
+    od_matrix_cache.set("matrix", body, generation)
+    return body
+
+
+async def od_flows(
+    db: AsyncSession,
+    origin_zone: Optional[int] = None,
+    destination_zone: Optional[int] = None,
+) -> Dict:
+    """The rows of the matrix leaving and/or entering one zone."""
+    stmt = _flows_stmt()
+    if origin_zone is not None:
+        stmt = stmt.where(ODFlow.origin_zone == origin_zone)
+    if destination_zone is not None:
+        stmt = stmt.where(ODFlow.destination_zone == destination_zone)
+    rows = (await db.execute(stmt)).all()
+    return _matrix(rows, await trip_modes.names(db))
+
+
+async def rebuild_od_matrix() -> int:
+    """Recount od_flow from every trip of an existing journey.
+
+    Returns the number of flows written.
+    """
+    flows: Flows = defaultdict(lambda: [0, 0.0])
+    async with AsyncSessionLocal() as db:
+        # Trip writers wait for the rebuild; the ones it waited for are
+        # committed and counted by it.
+        await db.execute(text("LOCK TABLE od_flow IN EXCLUSIVE MODE"))
+        await db.execute(delete(ODFlow))
+        result = await db.stream(
+            _trip_ends_stmt()
+            .where(Trip.journey_id.isnot(None))
+            .execution_options(yield_per=OD_REBUILD_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            aggregate_flows(rows, flows)
+        await _add_flows(db, flows)
+        await db.commit()
+    invalidate_od_matrix()
+    return len(flows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m Tools.odMatrix",
+        description="Maintain the origin-destination matrix.",
+    )
+    parser.add_argument("command", choices=("rebuild",), help="recount every trip")
+    parser.parse_args()
+    print(asyncio.run(rebuild_od_matrix()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+from Tools.timestamps import parse_timestamp
+
+
+# Keyset cursors are opaque to clients: a base64url JSON list of the sort
+# key values of the last row on a page. Datetimes are tagged so they come
+# back as datetimes.
+
+
+def encode_cursor(*values: Any) -> str:
+    encoded = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(encoded, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, *types: type) -> List[Any]:
+    """Sort key values stored in a cursor, one of each of ``types``.
+
+    Raises ValueError if the cursor is malformed or a value has the wrong
+    type, so a tampered cursor never reaches the database.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Malformed cursor")
+    return [_cursor_value(value, type_) for value, type_ in zip(values, types)]
+
+
+def _cursor_value(value: Any, type_: type) -> Any:
+    if type_ is datetime:
+        if not (
+            isinstance(value, dict)
+            and list(value) == ["dt"]
+            and isinstance(value["dt"], str)
+        ):
+            raise ValueError("Malformed cursor")
+        try:
+            return parse_timestamp(value["dt"])
+        except ValueError as e:
+            raise ValueError("Malformed cursor") from e
+    # bool is an int subclass but never a sort key.
+    if not isinstance(value, type_) or isinstance(value, bool):
+        raise ValueError("Malformed cursor")
+    return value
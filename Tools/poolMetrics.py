@@ -0,0 +1,139 @@
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Keys of PoolMetrics.snapshot() that only ever grow; the rest are gauges.
+POOL_COUNTERS = (
+    "checkouts",
+    "checkins",
+    "connects",
+    "invalidations",
+    "timeouts",
+    "checkout_wait_seconds_total",
+)
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by pool events and checkouts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.checkout_wait_seconds_total += seconds
+            if seconds > self.checkout_wait_seconds_max:
+                self.checkout_wait_seconds_max = seconds
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def increment(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            waits = self.waits
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_wait_seconds_total": self.checkout_wait_seconds_total,
+                "checkout_wait_seconds_avg": (
+                    self.checkout_wait_seconds_total / waits if waits else 0.0
+                ),
+                "checkout_wait_seconds_max": self.checkout_wait_seconds_max,
+            }
+
+
+class _TimedCheckoutMixin:
+    """Times how long ``_do_get`` waits for a free or new connection.
+
+    SQLAlchemy has no "checkout started" event, so the wait is measured
+    around the pool's own acquire step. Timeouts are counted before the
+    error propagates to the caller.
+    """
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the
+        # same metrics object.
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(
+    _TimedCheckoutMixin, AsyncAdaptedQueuePool
+):
+    pass
+
+
+def instrument_pool(engine) -> PoolMetrics:
+    """Attach a PoolMetrics to a (sync) engine using an instrumented pool."""
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.increment("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.increment("checkins")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.increment("connects")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.increment("invalidations")
+
+    return metrics
+
+
+def pool_status(engine) -> Dict[str, float]:
+    """Live occupancy of an engine's pool plus its counters."""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # QueuePool counts overflow from -pool_size until the pool is full.
+        "overflow": max(pool.overflow(), 0),
+        **pool.metrics.snapshot(),
+    }
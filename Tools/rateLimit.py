@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+
+from models import RateLimit
+
+
+class PostgresRateLimiter:
+    """Rate limiter whose budget is shared by every process on one database.
+
+    Each ``acquire`` reserves the next free slot of the ``rate_limit`` row
+    ``name`` with one upsert, which the row lock serialises across workers
+    and hosts, then sleeps until that slot outside any transaction.
+    """
+
+    def __init__(self, bind: Engine, name: str, rate: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.bind = bind
+        self.name = name
+        self.rate = rate
+
+    def _reserve(self, timeout: Optional[float]) -> Optional[float]:
+        """Seconds until the reserved slot, or None when none is free in time."""
+        interval = timedelta(seconds=1 / self.rate)
+        slot = func.greatest(RateLimit.next_at, func.clock_timestamp())
+        stmt = pg_insert(RateLimit).values(
+            name=self.name, next_at=func.clock_timestamp() + interval
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RateLimit.name],
+            set_={"next_at": slot + interval},
+            where=(
+                None
+                if timeout is None
+                else slot <= func.clock_timestamp() + timedelta(seconds=timeout)
+            ),
+        ).returning(
+            func.extract("epoch", RateLimit.next_at - interval - func.clock_timestamp())
+        )
+        with self.bind.begin() as conn:
+            wait = conn.execute(stmt).scalar_one_or_none()
+        return None if wait is None else max(float(wait), 0.0)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a slot, waiting at most ``timeout`` seconds (None = forever)."""
+        wait = self._reserve(timeout)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
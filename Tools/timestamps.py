@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+from typing import Annotated, Any
+
+from pydantic import BeforeValidator
+
+
+# Timestamps are stored in "timestamp without time zone" columns, which
+# asyncpg refuses to bind an aware datetime to. Every timestamp a client
+# sends (ingest, filters, cursors) goes through parse_timestamp: one with an
+# offset ("+05:30", "Z") is converted to UTC and stored naive, one without
+# is stored as sent.
+
+
+def naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """ISO 8601 timestamp as a naive datetime; raises ValueError if invalid."""
+    if isinstance(value, datetime):
+        return naive_utc(value)
+    if not isinstance(value, str):
+        raise ValueError("Expected an ISO 8601 timestamp")
+    try:
+        return naive_utc(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"Invalid ISO 8601 timestamp: {value!r}") from None
+
+
+# Request fields and query parameters; invalid values are a 422.
+Timestamp = Annotated[datetime, BeforeValidator(parse_timestamp)]
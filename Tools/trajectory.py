@@ -0,0 +1,245 @@
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import DataCollector
+
+
+EARTH_RADIUS_KM = 6371.0088
+# A step implying a faster speed than this (km/h) is a GPS glitch.
+MAX_PLAUSIBLE_SPEED_KMH = float(os.getenv("TRACE_MAX_SPEED_KMH", "350"))
+# Steps between two fixes that both report less than this (km/h) are
+# stationary jitter and contribute no distance.
+STATIONARY_SPEED_KMH = float(os.getenv("TRACE_STATIONARY_SPEED_KMH", "1.0"))
+# Simplification keeps every fix that is further than this many metres
+# off the simplified line, or whose speed differs from the speed
+# interpolated along it by more than the speed tolerance (km/h).
+SIMPLIFY_TOLERANCE_M = float(os.getenv("TRACE_SIMPLIFY_TOLERANCE_M", "15"))
+SIMPLIFY_SPEED_TOLERANCE_KMH = float(
+    os.getenv("TRACE_SIMPLIFY_SPEED_TOLERANCE_KMH", "5")
+)
+
+
+def trace_arrays(tripsData: Sequence[DataCollector]):
+    """Latitude, longitude, speed and timestamp columns of a trace."""
+    latitude = np.fromiter((p.latitude for p in tripsData), dtype=np.float64)
+    longitude = np.fromiter((p.longitude for p in tripsData), dtype=np.float64)
+    speed = np.fromiter((p.speed for p in tripsData), dtype=np.float64)
+    timestamp = np.array(
+        [np.datetime64(p.timestamp, "s") for p in tripsData], dtype="datetime64[s]"
+    )
+    return latitude, longitude, speed, timestamp
+
+
+def _as_datetime64(value: str) -> np.datetime64:
+    # Trace timestamps are stored naive, so any offset is dropped to match.
+    return np.datetime64(datetime.fromisoformat(value).replace(tzinfo=None), "s")
+
+
+def haversine_km_vec(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Element-wise great-circle distance in km."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2) - np.radians(lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _drop_spikes(latitude, longitude, seconds, max_passes: int = 3) -> np.ndarray:
+    """Mask of fixes to keep after removing single-point position spikes.
+
+    A fix is a spike when both the step into it and the step out of it are
+    implausibly fast but skipping it is not.
+    """
+    keep = np.ones(latitude.size, dtype=bool)
+    for _ in range(max_passes):
+        index = np.flatnonzero(keep)
+        if index.size < 3:
+            break
+        lat, lon, t = latitude[index], longitude[index], seconds[index]
+        step = haversine_km_vec(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        hours = np.maximum(np.diff(t), 1.0) / 3600.0
+        fast = step / hours > MAX_PLAUSIBLE_SPEED_KMH
+        skip = haversine_km_vec(lat[:-2], lon[:-2], lat[2:], lon[2:])
+        skip_hours = np.maximum(t[2:] - t[:-2], 1.0) / 3600.0
+        spike = fast[:-1] & fast[1:] & (skip / skip_hours <= MAX_PLAUSIBLE_SPEED_KMH)
+        if not spike.any():
+            break
+        keep[index[1:-1][spike]] = False
+    return keep
+
+
+def path_length_km(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    speed: np.ndarray,
+    seconds: np.ndarray,
+) -> float:
+    """Length of a GPS trace in km, ignoring spikes and stationary jitter."""
+    if latitude.size < 2:
+        return 0.0
+    keep = _drop_spikes(latitude, longitude, seconds)
+    lat, lon, spd = latitude[keep], longitude[keep], speed[keep]
+    step = haversine_km_vec(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    stationary = (spd[:-1] < STATIONARY_SPEED_KMH) & (spd[1:] < STATIONARY_SPEED_KMH)
+    return float(step[~stationary].sum())
+
+
+def segment_distances_km(
+    tripsData: Sequence[DataCollector], trips: List[dict]
+) -> List[Optional[float]]:
+    """Path length of every classified segment, measured on the raw trace.
+
+    Each segment covers the fixes between its origin and destination
+    timestamps. Segments with fewer than two fixes get None so the caller
+    can fall back to routing between the endpoints.
+    """
+    if not tripsData:
+        return [None] * len(trips)
+    latitude, longitude, speed, timestamp = trace_arrays(tripsData)
+    seconds = (timestamp - timestamp[0]).astype(np.float64)
+
+    distances: List[Optional[float]] = []
+    for trip in trips:
+        start = _as_datetime64(trip["origin"]["timestamp"])
+        end = _as_datetime64(trip["destination"]["timestamp"])
+        lo = np.searchsorted(timestamp, start, side="left")
+        hi = np.searchsorted(timestamp, end, side="right")
+        if hi - lo < 2:
+            distances.append(None)
+            continue
+        distances.append(
+            path_length_km(
+                latitude[lo:hi], longitude[lo:hi], speed[lo:hi], seconds[lo:hi]
+            )
+        )
+    return distances
+
+
+def simplify_mask(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    speed: Optional[np.ndarray] = None,
+    tolerance_m: Optional[float] = None,
+    speed_tolerance_kmh: Optional[float] = None,
+) -> np.ndarray:
+    """Mask of the significant fixes of a trace (speed-aware Douglas-Peucker).
+
+    Every dropped fix lies within ``tolerance_m`` of the simplified line
+    and, when ``speed`` is given, within ``speed_tolerance_kmh`` of the
+    speed interpolated between its kept neighbours, so mode changes and
+    stops survive. Instead of recursing, each pass splits every span at its
+    worst fix at once, which needs about log2(n) vectorized passes.
+    """
+    if tolerance_m is None:
+        tolerance_m = SIMPLIFY_TOLERANCE_M
+    if speed_tolerance_kmh is None:
+        speed_tolerance_kmh = SIMPLIFY_SPEED_TOLERANCE_KMH
+    n = latitude.size
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+    keep[1:-1] = False
+
+    # Local equirectangular projection in metres; plenty accurate for the
+    # few-km spans a trip covers.
+    scale = EARTH_RADIUS_KM * 1000.0
+    x = np.radians(longitude - longitude[0]) * scale * np.cos(
+        np.radians(latitude.mean())
+    )
+    y = np.radians(latitude - latitude[0]) * scale
+    index = np.arange(n)
+
+    while True:
+        anchors = np.flatnonzero(keep)
+        span = np.minimum(
+            np.searchsorted(anchors, index, side="right") - 1, anchors.size - 2
+        )
+        a, b = anchors[span], anchors[span + 1]
+
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x - x[a], y - y[a]
+        length2 = dx * dx + dy * dy
+        t = np.clip(
+            (px * dx + py * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0
+        )
+        error = np.hypot(px - t * dx, py - t * dy) / tolerance_m
+        if speed is not None and speed_tolerance_kmh > 0:
+            expected = speed[a] + (speed[b] - speed[a]) * (index - a) / (b - a)
+            error = np.maximum(error, np.abs(speed - expected) / speed_tolerance_kmh)
+        error[keep] = 0.0
+
+        worst = np.maximum.reduceat(error, anchors[:-1])
+        split = worst[span] > 1.0
+        candidates = np.flatnonzero(split & (error == worst[span]))
+        if candidates.size == 0:
+            return keep
+        # One fix per span; ties go to the earliest.
+        _, first = np.unique(span[candidates], return_index=True)
+        keep[candidates[first]] = True
+
+
+def simplify_trace(tripsData: Sequence[DataCollector]) -> List[DataCollector]:
+    """The significant fixes of a chronological trace, see simplify_mask."""
+    if len(tripsData) < 3:
+        return list(tripsData)
+    latitude, longitude, speed, _ = trace_arrays(tripsData)
+    keep = simplify_mask(latitude, longitude, speed)
+    return [tripsData[i] for i in np.flatnonzero(keep)]
+
+
+# Stored traces: microdegree coordinates and whole-second times, delta
+# encoded so consecutive fixes compress well, and speed in 0.1 km/h.
+_TRACE_HEADER = struct.Struct("<Iq")
+
+
+def encode_trace(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    speed: np.ndarray,
+    timestamp: np.ndarray,
+) -> bytes:
+    epoch = timestamp.astype("datetime64[s]").astype(np.int64)
+    start = int(epoch[0]) if epoch.size else 0
+    columns = (
+        np.diff(np.round(latitude * 1e6).astype(np.int64), prepend=0).astype("<i4"),
+        np.diff(np.round(longitude * 1e6).astype(np.int64), prepend=0).astype("<i4"),
+        np.clip(np.round(speed * 10), 0, 65535).astype("<u2"),
+        np.diff(epoch - start, prepend=0).astype("<i4"),
+    )
+    body = b"".join(column.tobytes() for column in columns)
+    return _TRACE_HEADER.pack(epoch.size, start) + zlib.compress(body, 9)
+
+
+def encode_simplified_trace(tripsData: Sequence[DataCollector]) -> Tuple[int, bytes]:
+    """Number of fixes kept by simplify_mask and their encoded trace."""
+    latitude, longitude, speed, timestamp = trace_arrays(tripsData)
+    keep = simplify_mask(latitude, longitude, speed)
+    return int(keep.sum()), encode_trace(
+        latitude[keep], longitude[keep], speed[keep], timestamp[keep]
+    )
+
+
+def decode_trace(data: bytes) -> List[dict]:
+    n, start = _TRACE_HEADER.unpack_from(data)
+    body = zlib.decompress(data[_TRACE_HEADER.size :])
+    latitude, longitude, speed, seconds = (
+        np.frombuffer(body, dtype=dtype, count=n, offset=offset)
+        for dtype, offset in (("<i4", 0), ("<i4", 4 * n), ("<u2", 8 * n), ("<i4", 10 * n))
+    )
+    latitude = np.cumsum(latitude, dtype=np.int64) / 1e6
+    longitude = np.cumsum(longitude, dtype=np.int64) / 1e6
+    timestamp = (start + np.cumsum(seconds, dtype=np.int64)).astype("datetime64[s]")
+    return [
+        {
+            "latitude": float(lat),
+            "longitude": float(lon),
+            "speed": float(spd) / 10,
+            "timestamp": str(ts),
+        }
+        for lat, lon, spd, ts in zip(latitude, longitude, speed, timestamp)
+    ]
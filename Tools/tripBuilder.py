@@ -0,0 +1,235 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Integer, and_, any_, bindparam, func, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from baseModel import JourneyBase
+from database import AsyncSessionLocal
+from models import DataCollector, Journey, JourneyTrace, LocationPoints, Trip
+from Tools.helperMethods import (
+    distance_travelled_batch,
+    geocode_cache_upsert,
+    lookup_executor,
+    resolve_location_names,
+    travel_mode_interprter,
+)
+from Tools.heatmap import lock_heatmap_sources
+from Tools.modeCache import trip_modes
+from Tools.odMatrix import add_trip_flows
+from Tools.trajectory import (
+    SIMPLIFY_TOLERANCE_M,
+    encode_simplified_trace,
+    segment_distances_km,
+)
+
+# Keep the simplified GPS trace of every new journey in journey_trace.
+STORE_JOURNEY_TRACES = os.getenv("STORE_JOURNEY_TRACES", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Class of the per-user advisory lock held while a journey is written, as
+# pg_advisory_xact_lock(JOURNEY_LOCK_CLASS, user_id).
+JOURNEY_LOCK_CLASS = 0x6A726E79
+
+
+async def build_journey(
+    db: AsyncSession,
+    user_id: int,
+    cutoff: datetime,
+    classifier: Optional[str] = None,
+) -> JourneyBase:
+    """Turn a user's unused GPS points up to ``cutoff`` into a journey.
+
+    The points are read in a short transaction of their own and the
+    classification, routing and geocoding run without holding a database
+    connection. Everything is then written through ``db`` but not
+    committed, so the caller can commit it together with its own
+    bookkeeping (or roll it back). Raises ValueError when there is nothing
+    to build a journey from, or when another build used the points first.
+    """
+    stmt = (
+        select(DataCollector)
+        .where(
+            and_(
+                DataCollector.user_id == user_id,
+                DataCollector.timestamp <= cutoff,
+                DataCollector.is_used.is_(False),
+            )
+        )
+        .order_by(DataCollector.timestamp)
+    )
+    async with AsyncSessionLocal() as read_db:
+        tripsData = (await read_db.execute(stmt)).scalars().all()
+    if not tripsData:
+        raise ValueError(f"No unused points for user {user_id} up to {cutoff}")
+    # Classification and trace maths are CPU bound (or a blocking LLM
+    # call) and run off the event loop.
+    trips = await run_in_threadpool(
+        travel_mode_interprter, tripsData, classifier=classifier
+    )
+    if not trips:
+        raise ValueError("No trips could be inferred from the recorded points")
+
+    # Distances are integrated along the recorded trace. Only segments
+    # with too few fixes fall back to routing, all in one OSRM call that
+    # runs while the endpoints are being geocoded.
+    distances = await run_in_threadpool(segment_distances_km, tripsData, trips)
+    unresolved = [i for i, d in enumerate(distances) if d is None]
+    routed = None
+    if unresolved:
+        routed = asyncio.wrap_future(
+            lookup_executor.submit(
+                distance_travelled_batch,
+                [
+                    (
+                        trips[i]["origin"]["latitude"],
+                        trips[i]["origin"]["longitude"],
+                        trips[i]["destination"]["latitude"],
+                        trips[i]["destination"]["longitude"],
+                    )
+                    for i in unresolved
+                ],
+            )
+        )
+
+    # Origin and destination names of every segment, in order. The
+    # journey's own endpoints are the first origin and last destination.
+    names, fetched_names = await run_in_threadpool(
+        resolve_location_names,
+        [
+            (trip[end]["latitude"], trip[end]["longitude"])
+            for trip in trips
+            for end in ("origin", "destination")
+        ],
+    )
+    if routed is not None:
+        for i, distance in zip(unresolved, await routed):
+            distances[i] = distance
+    if STORE_JOURNEY_TRACES:
+        point_count, trace = await run_in_threadpool(
+            encode_simplified_trace, tripsData
+        )
+
+    # Everything below is one short transaction. One build per user at a
+    # time: another job for the same user (a retry, or a job reclaimed
+    # while still running) waits on the lock and then finds the points it
+    # read already used, and gives up before writing anything.
+    await db.execute(
+        select(func.pg_advisory_xact_lock(JOURNEY_LOCK_CLASS, user_id))
+    )
+    stmt = (
+        update(DataCollector)
+        .where(
+            DataCollector.id
+            == any_(
+                bindparam(
+                    "point_ids",
+                    value=[tripData.id for tripData in tripsData],
+                    type_=ARRAY(Integer),
+                )
+            ),
+            DataCollector.is_used.is_(False),
+        )
+        .values(is_used=True)
+        .execution_options(synchronize_session=False)
+    )
+    if (await db.execute(stmt)).rowcount != len(tripsData):
+        raise ValueError(
+            f"Points of user {user_id} up to {cutoff} were used by another build"
+        )
+
+    # Names looked up remotely are stored in the geocode cache, and the
+    # journey, its location points and trips are bulk inserted before the
+    # only commit.
+    await lock_heatmap_sources(db)
+    if fetched_names:
+        await db.execute(geocode_cache_upsert(fetched_names))
+    journey = Journey(
+        origin=names[0],
+        destination=names[-1],
+        user_id=user_id,
+        start_time=datetime.fromisoformat(trips[0]["origin"]["timestamp"]),
+        end_time=datetime.fromisoformat(trips[-1]["destination"]["timestamp"]),
+        is_verified_by_user=False,
+    )
+    db.add(journey)
+    await db.flush()
+
+    if STORE_JOURNEY_TRACES:
+        db.add(
+            JourneyTrace(
+                journey_id=journey.id,
+                point_count=point_count,
+                raw_point_count=len(tripsData),
+                tolerance_m=SIMPLIFY_TOLERANCE_M,
+                trace=trace,
+            )
+        )
+
+    mode_ids = await trip_modes.ids_for(db, {trip["mode"] for trip in trips})
+
+    stmt = insert(LocationPoints).returning(
+        LocationPoints.id, sort_by_parameter_order=True
+    )
+    point_ids = (
+        await db.scalars(
+            stmt,
+            [
+                {
+                    "latitude": trip[end]["latitude"],
+                    "longitude": trip[end]["longitude"],
+                    "location_name": names[2 * index + offset],
+                }
+                for index, trip in enumerate(trips)
+                for offset, end in enumerate(("origin", "destination"))
+            ],
+        )
+    ).all()
+
+    trip_rows = [
+        {
+            "user_id": user_id,
+            "mode_id": mode_ids[trip["mode"].upper()],
+            "journey_id": journey.id,
+            "origin_location_id": point_ids[2 * index],
+            "destination_location_id": point_ids[2 * index + 1],
+            "start_time": datetime.fromisoformat(trip["origin"]["timestamp"]),
+            "end_time": datetime.fromisoformat(trip["destination"]["timestamp"]),
+            "distance_travelled": distance,
+            "co_travellers": 0,
+        }
+        for index, (trip, distance) in enumerate(zip(trips, distances))
+    ]
+    stmt = insert(Trip).returning(Trip.id, sort_by_parameter_order=True)
+    await db.scalars(stmt, trip_rows)
+    await add_trip_flows(
+        db,
+        [
+            (
+                trip["origin"]["latitude"],
+                trip["origin"]["longitude"],
+                trip["destination"]["latitude"],
+                trip["destination"]["longitude"],
+                row["mode_id"],
+                row["start_time"],
+                row["distance_travelled"],
+            )
+            for trip, row in zip(trips, trip_rows)
+        ],
+    )
+
+    return JourneyBase(
+        id=journey.id,
+        origin=journey.origin,
+        destination=journey.destination,
+        start_time=str(journey.start_time),
+        end_time=str(journey.end_time),
+        purpose=journey.purpose,
+        is_verified_by_user=journey.is_verified_by_user,
+    )
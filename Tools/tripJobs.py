@@ -0,0 +1,194 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import TripInferenceJob
+from Tools.modeShare import invalidate_mode_share
+from Tools.odMatrix import invalidate_od_matrix
+from Tools.tripBuilder import build_journey
+
+
+# Trip inference runs on a small pool of workers per process instead of
+# inside the request. Jobs live in the trip_inference_job table and are
+# claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+# processes can share the queue. TRIP_JOB_WORKERS=0 disables the workers
+# (e.g. for API-only processes); jobs then wait for another process.
+TRIP_JOB_WORKERS = int(os.getenv("TRIP_JOB_WORKERS", "2"))
+TRIP_JOB_POLL_SECONDS = float(os.getenv("TRIP_JOB_POLL_SECONDS", "2"))
+# A job left "running" this long belongs to a worker that died and is
+# claimed again, or failed once it has used up its attempts. Running jobs
+# refresh updated_at every TRIP_JOB_HEARTBEAT_SECONDS, so a slow job is
+# never mistaken for a dead one.
+TRIP_JOB_STALE_SECONDS = float(os.getenv("TRIP_JOB_STALE_SECONDS", "300"))
+TRIP_JOB_HEARTBEAT_SECONDS = float(
+    os.getenv("TRIP_JOB_HEARTBEAT_SECONDS", str(TRIP_JOB_STALE_SECONDS / 3))
+)
+TRIP_JOB_MAX_ATTEMPTS = int(os.getenv("TRIP_JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Set on enqueue so this process's idle workers start at once rather than
+# on their next poll.
+_wakeup: Optional[asyncio.Event] = None
+
+
+async def enqueue_trip_job(
+    db: AsyncSession,
+    user_id: int,
+    cutoff: datetime,
+    classifier: Optional[str] = None,
+) -> TripInferenceJob:
+    job = TripInferenceJob(
+        user_id=user_id, cutoff=cutoff, classifier=classifier, status=QUEUED
+    )
+    db.add(job)
+    await db.commit()
+    if _wakeup is not None:
+        _wakeup.set()
+    return job
+
+
+async def _claim_job() -> Optional[TripInferenceJob]:
+    """Mark the oldest claimable job as running and return it."""
+    stale_before = datetime.now() - timedelta(seconds=TRIP_JOB_STALE_SECONDS)
+    stale = and_(
+        TripInferenceJob.status == RUNNING,
+        TripInferenceJob.updated_at < stale_before,
+    )
+    stmt = (
+        select(TripInferenceJob)
+        .where(
+            or_(
+                TripInferenceJob.status == QUEUED,
+                and_(stale, TripInferenceJob.attempts < TRIP_JOB_MAX_ATTEMPTS),
+            )
+        )
+        .order_by(TripInferenceJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    async with AsyncSessionLocal() as db:
+        # A job whose worker died on its last attempt (or that keeps
+        # taking its process down) is not run again.
+        await db.execute(
+            update(TripInferenceJob)
+            .where(stale, TripInferenceJob.attempts >= TRIP_JOB_MAX_ATTEMPTS)
+            .values(status=FAILED, error="Worker stopped while running the job")
+            .execution_options(synchronize_session=False)
+        )
+        job = (await db.execute(stmt)).scalar_one_or_none()
+        if job is None:
+            await db.commit()
+            return None
+        job.status = RUNNING
+        job.attempts += 1
+        job.updated_at = datetime.now()
+        await db.commit()
+        return job
+
+
+async def _heartbeat(job_id: int) -> None:
+    """Keep a running job's updated_at fresh so it is not reclaimed."""
+    while True:
+        await asyncio.sleep(TRIP_JOB_HEARTBEAT_SECONDS)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(TripInferenceJob)
+                    .where(
+                        TripInferenceJob.id == job_id,
+                        TripInferenceJob.status == RUNNING,
+                    )
+                    .values(updated_at=datetime.now())
+                )
+                await db.commit()
+        except Exception as e:
+            print("Error:", e)
+
+
+async def _run_job(job: TripInferenceJob) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job.id))
+    try:
+        await _build_job_journey(job)
+    finally:
+        heartbeat.cancel()
+
+
+async def _build_job_journey(job: TripInferenceJob) -> None:
+    async with AsyncSessionLocal() as db:
+        try:
+            journey = await build_journey(
+                db, job.user_id, job.cutoff, job.classifier
+            )
+            # The journey and the job's completion commit together, so a
+            # crash in between re-runs the job rather than duplicating it.
+            await db.execute(
+                update(TripInferenceJob)
+                .where(TripInferenceJob.id == job.id)
+                .values(status=DONE, journey_id=journey.id, error=None)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            # Missing input will not appear on a retry.
+            retry = not isinstance(e, ValueError) and (
+                job.attempts < TRIP_JOB_MAX_ATTEMPTS
+            )
+            # Only while still running: a copy of this job that was
+            # reclaimed and finished first keeps its outcome.
+            await db.execute(
+                update(TripInferenceJob)
+                .where(
+                    TripInferenceJob.id == job.id,
+                    TripInferenceJob.status == RUNNING,
+                )
+                .values(status=QUEUED if retry else FAILED, error=str(e))
+            )
+            await db.commit()
+            print("Error:", e)
+            return
+    invalidate_mode_share()
+    invalidate_od_matrix()
+
+
+async def _worker() -> None:
+    while True:
+        try:
+            job = await _claim_job()
+        except Exception as e:
+            print("Error:", e)
+            job = None
+        if job is not None:
+            try:
+                await _run_job(job)
+            except Exception as e:
+                # The job stays "running" and is claimed again once stale.
+                print("Error:", e)
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), TRIP_JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start_trip_workers() -> List[asyncio.Task]:
+    global _wakeup
+    _wakeup = asyncio.Event()
+    return [asyncio.create_task(_worker()) for _ in range(TRIP_JOB_WORKERS)]
+
+
+async def stop_trip_workers(workers: List[asyncio.Task]) -> None:
+    # A job interrupted here stays "running" and is picked up again once
+    # it is stale.
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
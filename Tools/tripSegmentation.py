@@ -0,0 +1,142 @@
+import os
+from typing import List, Sequence
+
+import numpy as np
+
+from models import DataCollector
+from Tools.trajectory import trace_arrays
+
+
+# Upper speed bound (km/h, inclusive) of every mode band. Anything above the
+# last bound is classified as TRAIN. These are the same bands the LLM prompt
+# in helperMethods.travel_mode_interprter asks the model to apply.
+SPEED_BANDS_KMH = [7.0, 25.0, 60.0, 120.0]
+MODES = ["WALKING", "CYCLING", "BUS", "CAR", "TRAIN"]
+
+SMOOTHING_WINDOW = int(os.getenv("SEGMENT_SMOOTHING_WINDOW", "5"))
+PAUSE_SPEED_KMH = float(os.getenv("SEGMENT_PAUSE_SPEED_KMH", "1.0"))
+PAUSE_SECONDS = float(os.getenv("SEGMENT_PAUSE_SECONDS", "180"))
+MIN_SEGMENT_SECONDS = float(os.getenv("SEGMENT_MIN_SECONDS", "60"))
+
+
+def _smooth(speed: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving average with edge padding so the length is kept."""
+    if window <= 1 or speed.size < window:
+        return speed
+    pad = window // 2
+    padded = np.pad(speed, (pad, window - 1 - pad), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+
+def _run_bounds(labels: np.ndarray):
+    """Start and end (exclusive) index of every run of equal labels."""
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [labels.size]))
+    return starts, ends
+
+
+def _absorb_short_runs(
+    labels: np.ndarray, seconds: np.ndarray, moving: np.ndarray
+) -> np.ndarray:
+    """Relabel runs shorter than MIN_SEGMENT_SECONDS with a neighbouring mode.
+
+    Short flickers (a bus slowing down to cycling speed at a stop, a car in
+    traffic) would otherwise split one trip into several. A short run takes
+    the label of the longer of its two neighbours.
+    """
+    labels = labels.copy()
+    while True:
+        starts, ends = _run_bounds(labels)
+        if starts.size <= 1:
+            return labels
+        durations = seconds[ends - 1] - seconds[starts]
+        # Runs of stationary points are pauses and must stay as split points.
+        candidates = np.flatnonzero(
+            (durations < MIN_SEGMENT_SECONDS) & moving[starts]
+        )
+        if candidates.size == 0:
+            return labels
+        for run in candidates[np.argsort(durations[candidates], kind="stable")]:
+            left = run - 1 if run > 0 and moving[starts[run - 1]] else None
+            right = (
+                run + 1
+                if run + 1 < starts.size and moving[starts[run + 1]]
+                else None
+            )
+            if left is None and right is None:
+                continue
+            if right is None or (
+                left is not None and durations[left] >= durations[right]
+            ):
+                labels[starts[run] : ends[run]] = labels[starts[left]]
+            else:
+                labels[starts[run] : ends[run]] = labels[starts[right]]
+            break
+        else:
+            return labels
+
+
+def segment_trips(tripsData: Sequence[DataCollector]) -> List[dict]:
+    """Split a chronological GPS trace into single-mode trip segments.
+
+    Speeds are smoothed, classified into the fixed speed bands, and runs of
+    the same mode are merged. Stationary stretches longer than
+    PAUSE_SECONDS, or gaps between fixes of that length, end a segment.
+    The result has the same shape as the LLM classifier's output.
+    """
+    if len(tripsData) < 2:
+        return []
+
+    latitude, longitude, speed, timestamp = trace_arrays(tripsData)
+    seconds = (timestamp - timestamp[0]).astype(np.float64)
+
+    smoothed = _smooth(speed, SMOOTHING_WINDOW)
+    labels = np.digitize(smoothed, SPEED_BANDS_KMH, right=True)
+    moving = smoothed >= PAUSE_SPEED_KMH
+
+    # Stationary points get label -1 so they form their own runs, and a gap
+    # between fixes longer than a pause forces a boundary even when the mode
+    # on either side is the same.
+    labels = np.where(moving, labels, -1)
+    labels = _absorb_short_runs(labels, seconds, moving)
+    gap = np.concatenate(([0], np.cumsum(np.diff(seconds) > PAUSE_SECONDS)))
+
+    starts, ends = _run_bounds(labels * (gap.max() + 1) + gap)
+    segments = []
+    for start, end in zip(starts, ends):
+        last = end - 1
+        if labels[start] < 0:
+            # Short standstills (traffic lights) belong to the trip around
+            # them; long ones separate trips and are dropped.
+            if seconds[last] - seconds[start] >= PAUSE_SECONDS:
+                continue
+            if segments:
+                segments[-1]["_end"] = last
+            continue
+        if last == start:
+            continue
+        if (
+            segments
+            and segments[-1]["_label"] == labels[start]
+            and seconds[start] - seconds[segments[-1]["_end"]] <= PAUSE_SECONDS
+        ):
+            segments[-1]["_end"] = last
+            continue
+        segments.append({"_label": labels[start], "_start": start, "_end": last})
+
+    def point(index: int) -> dict:
+        return {
+            "latitude": float(latitude[index]),
+            "longitude": float(longitude[index]),
+            "timestamp": str(timestamp[index]),
+        }
+
+    return [
+        {
+            "origin": point(segment["_start"]),
+            "destination": point(segment["_end"]),
+            "mode": MODES[segment["_label"]],
+        }
+        for segment in segments
+    ]
@@ -1,6 +1,8 @@
 from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
+from Tools.timestamps import Timestamp
+
 
 class UserBase(BaseModel):
     age: int
@@ -22,20 +24,24 @@ class ComplaintBase(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class NearbyComplaintBase(ComplaintBase):
+    distance_m: float
+
+
 class TripRequestBase(BaseModel):
     user_id: int
     latitude: float
     longitude: float
     speed: float
-    timestamp: str
+    timestamp: Timestamp
 
     model_config = ConfigDict(from_attributes=True)
 
 
 class JourneyBase(BaseModel):
     id: int
-    origin: str
-    destination: str
+    origin: Optional[str] = None
+    destination: Optional[str] = None
     start_time: str
     end_time: str
     purpose: Optional[str] = None
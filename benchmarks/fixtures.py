@@ -0,0 +1,141 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+# Benchmarks run against a throwaway Postgres cluster created with initdb
+# in a temp directory (listening on a unix socket only), or against the
+# database configured in the DB_* settings with --db env. That database
+# is truncated, so never point it at real data.
+#
+# There is no SQLite fallback for the app itself: it relies on asyncpg,
+# ON CONFLICT upserts, = ANY(array), partial indexes and SKIP LOCKED.
+# Without Postgres the database scenarios are skipped and only the
+# offline ones run.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES = (
+    "od_flow",
+    "heatmap_bin",
+    "heatmap_watermark",
+    "trip_inference_job",
+    "journey_trace",
+    "trip",
+    "journey",
+    "location_points",
+    "data_collector",
+    "complaint",
+    "estimated_route_time",
+    "geocode_cache",
+    "trip_mode",
+    '"user"',
+)
+TRIP_MODES = ("WALKING", "CYCLING", "BUS", "CAR", "TRAIN")
+
+
+def _pg_bin(name: str) -> Optional[str]:
+    bindir = os.getenv("BENCH_PG_BIN")
+    if bindir:
+        path = os.path.join(bindir, name)
+        return path if os.path.exists(path) else None
+    path = shutil.which(name)
+    if path:
+        return path
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        bindir = subprocess.run(
+            [pg_config, "--bindir"], capture_output=True, text=True
+        ).stdout.strip()
+        path = os.path.join(bindir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+@contextmanager
+def temporary_postgres() -> Iterator[Optional[Dict[str, str]]]:
+    """DB_* settings of a fresh cluster, or None if Postgres is unavailable."""
+    initdb, pg_ctl = _pg_bin("initdb"), _pg_bin("pg_ctl")
+    if not initdb or not pg_ctl:
+        yield None
+        return
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        # initdb refuses to run as root.
+        yield None
+        return
+
+    directory = tempfile.mkdtemp(prefix="bench-pg-")
+    data = os.path.join(directory, "data")
+    try:
+        subprocess.run(
+            [initdb, "-D", data, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+            check=True,
+            capture_output=True,
+        )
+        options = f"-c listen_addresses='' -k {directory} -c fsync=off"
+        subprocess.run(
+            [pg_ctl, "-D", data, "-o", options, "-w", "-l",
+             os.path.join(directory, "log"), "start"],
+            check=True,
+            capture_output=True,
+        )
+        settings = {
+            "DB_USER": "postgres",
+            "DB_PASSWORD": "",
+            "DB_HOST": "",
+            "DB_NAME": f"postgres?host={directory}",
+        }
+        yield settings
+    finally:
+        subprocess.run(
+            [pg_ctl, "-D", data, "-m", "immediate", "stop"], capture_output=True
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def migrate() -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+
+
+def reset_database(users: int = 1) -> None:
+    """Empty every table and seed the trip modes and ``users`` users."""
+    from database import engine
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO trip_mode (mode_name) VALUES "
+            + ", ".join(f"('{mode}')" for mode in TRIP_MODES)
+        )
+        conn.exec_driver_sql(
+            'INSERT INTO "user" (age, gender, streak) '
+            "SELECT 20 + g %% 40, 'F', 0 FROM generate_series(1, %(users)s) g",
+            {"users": users},
+        )
+        conn.exec_driver_sql("ANALYZE")
+
+
+def wait_for_database(timeout: float = 10.0) -> None:
+    from database import engine
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
@@ -0,0 +1,113 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class Result:
+    """Latencies and errors of one measured operation."""
+
+    def __init__(self, name: str, unit: str = "req"):
+        self.name = name
+        self.unit = unit
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+        # Items per operation, e.g. points per bulk request.
+        self.items = 0
+        self.notes: Dict[str, object] = {}
+
+    def summary(self) -> Dict[str, object]:
+        values = sorted(self.latencies)
+        count = len(values)
+        summary = {
+            "name": self.name,
+            "count": count,
+            "errors": self.errors,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "mean_ms": (sum(values) / count * 1000) if count else 0.0,
+            "throughput": (count / self.elapsed) if self.elapsed else 0.0,
+            "unit": self.unit,
+        }
+        if self.items:
+            summary["items_per_s"] = self.items / self.elapsed if self.elapsed else 0.0
+        summary.update(self.notes)
+        return summary
+
+
+async def run_load(
+    name: str,
+    operation: Callable[[int], Awaitable[Optional[int]]],
+    total: int,
+    concurrency: int,
+    unit: str = "req",
+) -> Result:
+    """Run ``operation(i)`` for i in range(total), ``concurrency`` at a time.
+
+    An operation fails by raising; it may return how many items it handled
+    (e.g. points in a batch) to report item throughput as well.
+    """
+    result = Result(name, unit)
+    queue = iter(range(total))
+
+    async def worker():
+        for index in queue:
+            started = time.perf_counter()
+            try:
+                items = await operation(index)
+            except Exception:
+                result.errors += 1
+                continue
+            result.latencies.append(time.perf_counter() - started)
+            if items:
+                result.items += items
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int = 5) -> Result:
+    """Time a synchronous callable ``repeat`` times."""
+    result = Result(name, unit="run")
+    started = time.perf_counter()
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        result.latencies.append(time.perf_counter() - begin)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def print_table(summaries: List[Dict[str, object]]) -> None:
+    header = f"{'scenario':44} {'n':>6} {'err':>4} {'p50 ms':>9} {'p99 ms':>9} {'thrpt/s':>9}"
+    print(header)
+    print("-" * len(header))
+    for summary in summaries:
+        print(
+            f"{summary['name']:44} {summary['count']:>6} {summary['errors']:>4} "
+            f"{summary['p50_ms']:>9.2f} {summary['p99_ms']:>9.2f} "
+            f"{summary['throughput']:>9.1f}"
+        )
+        extras = {
+            key: value
+            for key, value in summary.items()
+            if key not in ("name", "count", "errors", "p50_ms", "p90_ms",
+                           "p99_ms", "mean_ms", "throughput", "unit")
+        }
+        if extras:
+            print("    " + ", ".join(
+                f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in extras.items()
+            ))
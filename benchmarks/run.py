@@ -0,0 +1,157 @@
+"""Offline benchmark and load-test runner.
+
+Run from the project root:
+
+    python -m benchmarks.run                      # every scenario
+    python -m benchmarks.run ingest reads --latency-ms 50
+    python -m benchmarks.run trace --db none      # no database needed
+    python -m benchmarks.run --json before.json   # keep results to compare
+
+The run exits with status 1 when a checking scenario (explain,
+trips_statements) reports ok=False.
+
+Nominatim, OSRM and Gemini are replaced by local stubs answering after
+--latency-ms (+/- --jitter-ms). The database is a throwaway Postgres
+cluster (--db temp, needs initdb on PATH or BENCH_PG_BIN, not as root) or
+the DB_* settings (--db env; its tables are truncated). Requests go
+through the ASGI app in-process unless --url points at a running server,
+which must use the same database and stub settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from contextlib import nullcontext
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.fixtures import migrate, temporary_postgres, wait_for_database
+from benchmarks.loadgen import print_table
+from benchmarks.stubs import start_stubs, stub_environment
+
+
+def parse_args(argv=None):
+    # Imported here for the scenario names only; the app is not loaded yet.
+    from benchmarks.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "scenarios", nargs="*",
+        help=f"scenarios to run (default: all): {', '.join(sorted(SCENARIOS))}",
+    )
+    parser.add_argument("--db", choices=("temp", "env", "none"), default="temp")
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--trace-points", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    args.scenarios = args.scenarios or sorted(SCENARIOS)
+    return args
+
+
+async def _run(args, has_db: bool):
+    import httpx
+
+    from benchmarks.scenarios import SCENARIOS, Context
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=300)
+        lifespan = nullcontext()
+    else:
+        from main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300
+        )
+        lifespan = app.router.lifespan_context(app)
+
+    summaries = []
+    async with lifespan, client:
+        ctx = Context(client, args, in_process=not args.url)
+        for name in args.scenarios:
+            scenario = SCENARIOS[name]
+            if scenario.needs_db and not has_db:
+                print(f"skipping {name}: no database", file=sys.stderr)
+                continue
+            for result in await scenario.run(ctx):
+                summaries.append(result.summary())
+    return summaries
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    stubs = start_stubs(args.latency_ms, args.jitter_ms)
+    os.environ.update(stub_environment(stubs))
+    # Workers of this process only; keep the app's queue polling snappy.
+    os.environ.setdefault("TRIP_JOB_POLL_SECONDS", "0.05")
+    # Scenarios refresh the heatmap themselves, when they measure it.
+    os.environ.setdefault("HEATMAP_REFRESH_SECONDS", "0")
+
+    fixture = temporary_postgres() if args.db == "temp" else nullcontext(
+        {} if args.db == "env" else None
+    )
+    try:
+        with fixture as settings:
+            has_db = settings is not None
+            if args.db == "temp" and not has_db:
+                print("no throwaway Postgres available; use --db env", file=sys.stderr)
+            if settings:
+                os.environ.update(settings)
+            if not has_db:
+                os.environ["TRIP_JOB_WORKERS"] = "0"
+            if has_db:
+                wait_for_database()
+                migrate()
+            summaries = asyncio.run(_run(args, has_db))
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    print_table(summaries)
+    # Scenarios that check something (an index, a statement budget) report
+    # ok=False when it does not hold; the run then fails.
+    failed = [summary["name"] for summary in summaries if summary.get("ok") is False]
+    if args.json:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "revision": revision,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    "args": vars(args),
+                    "results": summaries,
+                    "stub_requests": {
+                        name: stub.requests for name, stub in stubs.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+    if failed:
+        print(f"failed checks: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
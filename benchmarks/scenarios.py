@@ -0,0 +1,839 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, NamedTuple
+
+import httpx
+
+from benchmarks.fixtures import reset_database
+from benchmarks.loadgen import Result, measure, run_load
+from benchmarks.traces import trace_of_length, user_day
+
+
+# Every scenario is an async function taking the run Context and returning
+# Results. Scenarios that need the database reset it first, so each one
+# starts from the same state regardless of order. The reset runs in a
+# thread: the app's trip workers share the event loop, and its TRUNCATE
+# waits for any transaction they have open.
+
+BENCH_DAY = datetime(2025, 1, 6)
+
+
+class Context:
+    def __init__(self, client: httpx.AsyncClient, args, in_process: bool):
+        self.client = client
+        self.args = args
+        self.in_process = in_process
+        self.rng = random.Random(args.seed)
+
+
+class Scenario(NamedTuple):
+    run: Callable
+    needs_db: bool
+    description: str
+
+
+SCENARIOS: Dict[str, Scenario] = {}
+
+
+def scenario(name: str, needs_db: bool, description: str):
+    def register(fn):
+        SCENARIOS[name] = Scenario(fn, needs_db, description)
+        return fn
+
+    return register
+
+
+def _check(response: httpx.Response) -> httpx.Response:
+    response.raise_for_status()
+    return response
+
+
+async def _ingest_days(ctx: Context, users: int) -> Dict[int, List[dict]]:
+    """Bulk-upload one synthetic day per user; returns the traces."""
+    traces = {
+        user_id: user_day(user_id, BENCH_DAY, ctx.rng) for user_id in range(1, users + 1)
+    }
+
+    async def upload(index: int):
+        points = traces[index + 1]
+        for start in range(0, len(points), 1000):
+            _check(
+                await ctx.client.post(
+                    "/create/api_required_data/bulk", json=points[start : start + 1000]
+                )
+            )
+
+    await run_load("seed", upload, users, ctx.args.concurrency)
+    return traces
+
+
+async def _seed_journeys(ctx: Context, users: int) -> None:
+    traces = await _ingest_days(ctx, users)
+
+    async def build(index: int):
+        user_id = index + 1
+        _check(
+            await ctx.client.post(
+                "/create/trip",
+                params={
+                    "user_id": user_id,
+                    "timestamp": traces[user_id][-1]["timestamp"],
+                    "wait": True,
+                },
+            )
+        )
+
+    await run_load("seed", build, users, ctx.args.concurrency)
+
+
+@scenario("ingest", True, "per-point vs bulk GPS ingest")
+async def ingest(ctx: Context) -> List[Result]:
+    await asyncio.to_thread(reset_database, users=ctx.args.users)
+    points = trace_of_length(ctx.args.requests, user_id=1, seed=ctx.args.seed)
+
+    async def single(index: int) -> int:
+        _check(await ctx.client.post("/create/api_required_data", json=points[index]))
+        return 1
+
+    per_point = await run_load(
+        "ingest: per-point POST", single, len(points), ctx.args.concurrency
+    )
+
+    await asyncio.to_thread(reset_database, users=ctx.args.users)
+    batch = ctx.args.batch_size
+    batches = [points[i : i + batch] for i in range(0, len(points), batch)]
+
+    async def bulk(index: int) -> int:
+        _check(await ctx.client.post("/create/api_required_data/bulk", json=batches[index]))
+        return len(batches[index])
+
+    bulk_result = await run_load(
+        f"ingest: bulk POST ({batch}/req)", bulk, len(batches), ctx.args.concurrency
+    )
+    return [per_point, bulk_result]
+
+
+@scenario("create_trip", True, "/create/trip inline (wait=true) and through the job queue")
+async def create_trip(ctx: Context) -> List[Result]:
+    users = ctx.args.users
+    results = []
+    for queued in (False, True):
+        await asyncio.to_thread(reset_database, users=users)
+        traces = await _ingest_days(ctx, users)
+
+        async def inline(index: int):
+            user_id = index + 1
+            _check(
+                await ctx.client.post(
+                    "/create/trip",
+                    params={
+                        "user_id": user_id,
+                        "timestamp": traces[user_id][-1]["timestamp"],
+                        "wait": True,
+                    },
+                )
+            )
+
+        async def via_queue(index: int):
+            user_id = index + 1
+            job = _check(
+                await ctx.client.post(
+                    "/create/trip",
+                    params={
+                        "user_id": user_id,
+                        "timestamp": traces[user_id][-1]["timestamp"],
+                    },
+                )
+            ).json()
+            while True:
+                state = _check(
+                    await ctx.client.get(f"/get/trip/job/{job['job_id']}")
+                ).json()
+                if state["status"] == "done":
+                    return
+                if state["status"] == "failed":
+                    raise RuntimeError(state["error"])
+                await asyncio.sleep(0.02)
+
+        results.append(
+            await run_load(
+                "create_trip: queued, enqueue to done" if queued else "create_trip: wait=true",
+                via_queue if queued else inline,
+                users,
+                ctx.args.concurrency,
+            )
+        )
+    return results
+
+
+_counting: ContextVar[bool] = ContextVar("counting", default=False)
+
+
+@contextmanager
+def _count_statements() -> Iterator[Dict[str, int]]:
+    """Count SQL statements and commits on both of the app's engines.
+
+    Only work started inside the block is counted (the context variable
+    follows requests into tasks and threadpool calls), not the trip job
+    workers or other background tasks sharing the engines.
+    """
+    from sqlalchemy import event
+
+    from database import async_engine, engine
+
+    counts = {"statements": 0, "commits": 0}
+
+    def on_statement(*args):
+        if _counting.get():
+            counts["statements"] += 1
+
+    def on_commit(*args):
+        if _counting.get():
+            counts["commits"] += 1
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", on_statement)
+        event.listen(target, "commit", on_commit)
+    token = _counting.set(True)
+    try:
+        yield counts
+    finally:
+        _counting.reset(token)
+        for target in engines:
+            event.remove(target, "before_cursor_execute", on_statement)
+            event.remove(target, "commit", on_commit)
+
+
+def _per_row_add_trip(user_id: int, cutoff: datetime) -> None:
+    """The writes of the original add_trip, kept as the "before" baseline.
+
+    A commit after the journey, after every pair of location points and
+    after every trip, and every consumed fix re-marked once per trip.
+    Names and distances come from the in-process cache and haversine, so
+    only the database work differs from /create/trip.
+    """
+    from sqlalchemy import and_, select
+
+    from database import SessionLocal
+    from models import DataCollector, Journey, LocationPoints, Trip, TripMode
+    from Tools.helperMethods import (
+        get_location_name,
+        haversine_km,
+        travel_mode_interprter,
+    )
+
+    with SessionLocal() as db:
+        stmt = (
+            select(DataCollector)
+            .where(
+                and_(
+                    DataCollector.user_id == user_id,
+                    DataCollector.timestamp <= cutoff,
+                    DataCollector.is_used.is_(False),
+                )
+            )
+            .order_by(DataCollector.timestamp)
+        )
+        tripsData = db.execute(stmt).scalars().all()
+        trips = travel_mode_interprter(tripsData)
+
+        def point(end: dict) -> LocationPoints:
+            return LocationPoints(
+                latitude=end["latitude"],
+                longitude=end["longitude"],
+                location_name=get_location_name(end["latitude"], end["longitude"]),
+            )
+
+        journey = Journey(
+            origin=get_location_name(
+                trips[0]["origin"]["latitude"], trips[0]["origin"]["longitude"]
+            ),
+            destination=get_location_name(
+                trips[-1]["destination"]["latitude"],
+                trips[-1]["destination"]["longitude"],
+            ),
+            user_id=user_id,
+            start_time=datetime.fromisoformat(trips[0]["origin"]["timestamp"]),
+            end_time=datetime.fromisoformat(trips[-1]["destination"]["timestamp"]),
+        )
+        db.add(journey)
+        db.commit()
+        db.refresh(journey)
+        for trip in trips:
+            origin, destination = point(trip["origin"]), point(trip["destination"])
+            db.add(origin)
+            db.add(destination)
+            db.commit()
+            db.refresh(origin)
+            db.refresh(destination)
+            stmt = select(TripMode).where(TripMode.mode_name == trip["mode"].upper())
+            mode = db.execute(stmt).scalars().first()
+            row = Trip(
+                user_id=user_id,
+                mode_id=mode.id,
+                journey_id=journey.id,
+                origin_location_id=origin.id,
+                destination_location_id=destination.id,
+                start_time=datetime.fromisoformat(trip["origin"]["timestamp"]),
+                end_time=datetime.fromisoformat(trip["destination"]["timestamp"]),
+                distance_travelled=haversine_km(
+                    origin.latitude,
+                    origin.longitude,
+                    destination.latitude,
+                    destination.longitude,
+                ),
+            )
+            db.add(row)
+            db.commit()
+            db.refresh(row)
+            for tripData in tripsData:
+                tripData.is_used = True
+                db.add(tripData)
+            db.commit()
+
+
+@scenario("add_trip_statements", True, "SQL statements and commits per journey, before and after")
+async def add_trip_statements(ctx: Context) -> List[Result]:
+    if not ctx.in_process:
+        return []
+    from starlette.concurrency import run_in_threadpool
+
+    from Tools.helperMethods import geocode_cache
+
+    results = []
+    traces = None
+    for label in ("per-row commits (before)", "one transaction (after)"):
+        # Both runs start from the same points and cold geocode caches, so
+        # the names are looked up (and stored) in each.
+        await asyncio.to_thread(reset_database, users=1)
+        geocode_cache.invalidate()
+        if traces is None:
+            traces = await _ingest_days(ctx, 1)
+        else:
+            _check(
+                await ctx.client.post("/create/api_required_data/bulk", json=traces[1])
+            )
+        cutoff = traces[1][-1]["timestamp"]
+
+        async def build(index: int, label=label):
+            if label.endswith("(before)"):
+                await run_in_threadpool(
+                    _per_row_add_trip, 1, datetime.fromisoformat(cutoff)
+                )
+                return
+            _check(
+                await ctx.client.post(
+                    "/create/trip",
+                    params={"user_id": 1, "timestamp": cutoff, "wait": True},
+                )
+            )
+
+        with _count_statements() as counts:
+            result = await run_load(f"add_trip: {label}", build, 1, 1)
+        result.notes.update(counts, fixes=len(traces[1]))
+        results.append(result)
+    return results
+
+
+# GET /get/trips must stay one joined query however many trips it returns.
+TRIPS_MAX_STATEMENTS = 1
+
+
+@scenario("trips_statements", True, "SQL statements per GET /get/trips as trips grow")
+async def trips_statements(ctx: Context) -> List[Result]:
+    if not ctx.in_process:
+        return []
+    results = []
+    for users in sorted({2, max(ctx.args.users, 2)}):
+        await asyncio.to_thread(reset_database, users=users)
+        await _seed_journeys(ctx, users)
+        trips = {}
+
+        async def read(index: int):
+            trips["count"] = len(_check(await ctx.client.get("/get/trips")).json())
+
+        with _count_statements() as counts:
+            result = await run_load(f"trips: GET /get/trips, {users} users", read, 1, 1)
+        result.notes.update(
+            counts,
+            trips=trips.get("count", 0),
+            ok=counts["statements"] <= TRIPS_MAX_STATEMENTS,
+        )
+        results.append(result)
+    return results
+
+
+@scenario("reads", True, "NATPAC read endpoints over seeded journeys")
+async def reads(ctx: Context) -> List[Result]:
+    users = ctx.args.users
+    await asyncio.to_thread(reset_database, users=users)
+    await _seed_journeys(ctx, users)
+
+    endpoints = [
+        ("/get/trips", {}),
+        ("/get/journey", {"limit": 100}),
+        ("/get/user/journey", None),
+        ("/get/user/distance", None),
+        ("/get/percentage", {}),
+        ("/get/complaints", {}),
+        ("/get/trips/export", {"format": "ndjson"}),
+    ]
+    results = []
+    for path, params in endpoints:
+
+        async def read(index: int, path=path, params=params):
+            if params is None:
+                query = {"user_id": index % users + 1}
+            else:
+                query = params
+            _check(await ctx.client.get(path, params=query))
+
+        results.append(
+            await run_load(
+                f"read: GET {path}", read, ctx.args.requests, ctx.args.concurrency
+            )
+        )
+    return results
+
+
+@scenario("engines", True, "the same query on the sync (threadpool) and async engines")
+async def engines(ctx: Context) -> List[Result]:
+    from sqlalchemy import select
+    from starlette.concurrency import run_in_threadpool
+
+    from database import AsyncSessionLocal, SessionLocal
+    from models import Journey
+
+    users = ctx.args.users
+    await asyncio.to_thread(reset_database, users=users)
+    await _seed_journeys(ctx, users)
+
+    def page(user_id: int):
+        return (
+            select(Journey)
+            .where(Journey.user_id == user_id)
+            .order_by(Journey.start_time.desc(), Journey.id.desc())
+            .limit(100)
+        )
+
+    def sync_query(user_id: int):
+        with SessionLocal() as db:
+            return db.execute(page(user_id)).scalars().all()
+
+    async def via_threadpool(index: int):
+        await run_in_threadpool(sync_query, index % users + 1)
+
+    async def via_async(index: int):
+        async with AsyncSessionLocal() as db:
+            (await db.execute(page(index % users + 1))).scalars().all()
+
+    return [
+        await run_load(
+            "engine: sync in threadpool", via_threadpool,
+            ctx.args.requests, ctx.args.concurrency,
+        ),
+        await run_load(
+            "engine: async (asyncpg)", via_async,
+            ctx.args.requests, ctx.args.concurrency,
+        ),
+    ]
+
+
+# Hot statements and the index each one is expected to use.
+def _hot_statements():
+    from sqlalchemy import and_, func, or_, select
+
+    from models import Complaint, DataCollector, Journey, Trip, TripInferenceJob
+    from routers.getRoutes import _in_bbox
+    from Tools.geoCell import distance_m, radius_bbox
+
+    distance = distance_m(Complaint.location_lat, Complaint.location_lon, 12.9, 74.85)
+    return [
+        (
+            "unused points of a user",
+            "ix_data_collector_user_id_timestamp_unused",
+            select(DataCollector)
+            .where(
+                and_(
+                    DataCollector.user_id == 7,
+                    DataCollector.timestamp <= datetime(2025, 6, 1),
+                    DataCollector.is_used.is_(False),
+                )
+            )
+            .order_by(DataCollector.timestamp),
+        ),
+        (
+            "journey page of a user",
+            "ix_journey_user_id_start_time",
+            select(Journey)
+            .where(Journey.user_id == 7)
+            .order_by(Journey.start_time.desc(), Journey.id.desc())
+            .limit(101),
+        ),
+        (
+            "journey page",
+            "ix_journey_start_time",
+            select(Journey)
+            .order_by(Journey.start_time.desc(), Journey.id.desc())
+            .limit(101),
+        ),
+        (
+            "trips of a journey",
+            "ix_trip_journey_id",
+            select(Trip).where(Trip.journey_id == 42),
+        ),
+        (
+            "distance of a user by mode",
+            "ix_trip_user_id_mode_id",
+            select(Trip.mode_id, func.sum(Trip.distance_travelled))
+            .where(Trip.user_id == 7)
+            .group_by(Trip.mode_id),
+        ),
+        (
+            "claimable trip job",
+            "ix_trip_inference_job_claimable",
+            select(TripInferenceJob)
+            .where(
+                or_(
+                    TripInferenceJob.status == "queued",
+                    and_(
+                        TripInferenceJob.status == "running",
+                        TripInferenceJob.updated_at < datetime(2025, 1, 1),
+                    ),
+                )
+            )
+            .order_by(TripInferenceJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True),
+        ),
+        (
+            "complaints in a viewport",
+            "ix_complaint_geocell",
+            select(Complaint.id)
+            .where(_in_bbox(12.85, 74.80, 12.95, 74.90))
+            .order_by(Complaint.id.desc())
+            .limit(101),
+        ),
+        (
+            "complaints near a point",
+            "ix_complaint_geocell",
+            select(Complaint.id, distance)
+            .where(_in_bbox(*radius_bbox(12.9, 74.85, 2000)), distance <= 2000)
+            .order_by(distance)
+            .limit(10),
+        ),
+    ]
+
+
+def _index_names(plan) -> List[str]:
+    names = []
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            names.append(plan["Index Name"])
+        for value in plan.values():
+            names.extend(_index_names(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            names.extend(_index_names(value))
+    return names
+
+
+@scenario("explain", True, "check that hot queries can use their indexes")
+async def explain(ctx: Context) -> List[Result]:
+    from sqlalchemy.dialects import postgresql
+
+    from database import engine
+    from Tools.geoCell import geocell
+
+    await asyncio.to_thread(reset_database, users=100)
+    results = []
+    # Seeded in a transaction that is rolled back, so the app's trip job
+    # workers never see (and start processing) the queued jobs.
+    with engine.connect() as conn:
+        # Enough rows for realistic statistics without a long seed.
+        conn.exec_driver_sql(
+            "INSERT INTO data_collector (user_id, latitude, longitude, speed, timestamp, is_used) "
+            "SELECT 1 + g %% 100, 12.9, 74.8, 10, timestamp '2025-01-01' + g * interval '10 seconds', "
+            "g %% 20 <> 0 FROM generate_series(1, 200000) g"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO journey (user_id, origin, destination, start_time, end_time, is_verified_by_user) "
+            "SELECT 1 + g %% 100, 'a', 'b', timestamp '2025-01-01' + g * interval '1 hour', "
+            "timestamp '2025-01-01' + g * interval '1 hour' + interval '30 minutes', false "
+            "FROM generate_series(1, 20000) g"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO trip (user_id, mode_id, journey_id, start_time, end_time, distance_travelled, co_travellers) "
+            "SELECT 1 + g %% 100, 1 + g %% 5, 1 + g / 2, timestamp '2025-01-01', timestamp '2025-01-01', 1.5, 0 "
+            "FROM generate_series(1, 39998) g"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO trip_inference_job (user_id, cutoff, status, attempts) "
+            "SELECT 1 + g %% 100, timestamp '2025-01-01', "
+            "CASE WHEN g > 19900 THEN 'queued' ELSE 'done' END, 1 "
+            "FROM generate_series(1, 20000) g"
+        )
+        rng = random.Random(ctx.args.seed)
+        complaints = [
+            (8 + rng.random() * 5, 74.5 + rng.random() * 3) for _ in range(100000)
+        ]
+        conn.exec_driver_sql(
+            "INSERT INTO complaint (user_id, location_lat, location_lon, geocell, description) "
+            "SELECT 1, lat, lon, cell, 'pothole' "
+            "FROM unnest(%(lat)s, %(lon)s, %(cell)s) AS c(lat, lon, cell)",
+            {
+                "lat": [lat for lat, _ in complaints],
+                "lon": [lon for _, lon in complaints],
+                "cell": [geocell(lat, lon) for lat, lon in complaints],
+            },
+        )
+        conn.exec_driver_sql("ANALYZE")
+
+        for label, expected, stmt in _hot_statements():
+            sql = str(
+                stmt.compile(
+                    dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+                )
+            )
+            plan = conn.exec_driver_sql(
+                "EXPLAIN (ANALYZE, FORMAT JSON) " + sql.replace("%", "%%")
+            ).scalar()
+            plan = plan[0] if isinstance(plan, list) else plan
+            used = _index_names(plan)
+            result = Result(f"explain: {label}", unit="query")
+            result.latencies.append(plan["Execution Time"] / 1000)
+            result.elapsed = result.latencies[0]
+            result.notes.update(
+                expected=expected,
+                ok=expected in used,
+                indexes=",".join(dict.fromkeys(used)) or "none",
+            )
+            results.append(result)
+        conn.rollback()
+    return results
+
+
+@scenario("trace", False, "segmentation, simplification and path length on a long trace")
+async def trace(ctx: Context) -> List[Result]:
+    from types import SimpleNamespace
+
+    import Tools.helperMethods as helpers
+    from Tools.trajectory import segment_distances_km, simplify_mask, trace_arrays
+    from Tools.tripSegmentation import segment_trips
+
+    n = ctx.args.trace_points
+    points = [
+        SimpleNamespace(
+            latitude=p["latitude"],
+            longitude=p["longitude"],
+            speed=p["speed"],
+            timestamp=datetime.fromisoformat(p["timestamp"]),
+        )
+        for p in trace_of_length(n, seed=ctx.args.seed)
+    ]
+    trips = segment_trips(points)
+    legs = [
+        (
+            trip["origin"]["latitude"],
+            trip["origin"]["longitude"],
+            trip["destination"]["latitude"],
+            trip["destination"]["longitude"],
+        )
+        for trip in trips
+    ]
+    latitude, longitude, speed, _ = trace_arrays(points)
+
+    def routed():
+        # Cold cache, so every run goes to the (stub) OSRM server.
+        helpers.route_cache.invalidate()
+        return helpers.distance_travelled_batch(legs)
+
+    results = [
+        measure(f"trace: segment_trips ({n} fixes)", lambda: segment_trips(points)),
+        measure(
+            f"trace: simplify_mask ({n} fixes)",
+            lambda: simplify_mask(latitude, longitude, speed),
+        ),
+        measure(
+            f"trace: path length of {len(trips)} segments",
+            lambda: segment_distances_km(points, trips),
+        ),
+        measure(f"trace: OSRM batch for {len(trips)} segments", routed),
+    ]
+    measured = segment_distances_km(points, trips)
+    results[2].notes["km"] = sum(d or 0.0 for d in measured)
+    results[3].notes["km"] = sum(routed())
+    results[1].notes["kept"] = int(simplify_mask(latitude, longitude, speed).sum())
+    return results
+
+
+def _natpac_rows(count: int, rng: random.Random) -> List[tuple]:
+    """Rows shaped like _natpac_trips_stmt() results."""
+    rows = []
+    for trip_id in range(1, count + 1):
+        start = BENCH_DAY.replace(hour=rng.randrange(6, 22), minute=rng.randrange(60))
+        rows.append(
+            (
+                trip_id,
+                rng.randrange(1, 500),
+                rng.choice(("F", "M")),
+                rng.randrange(18, 70),
+                (trip_id + 2) // 3,
+                12.8 + rng.random() / 10,
+                74.8 + rng.random() / 10,
+                f"Area {rng.randrange(1000)}, Mangaluru",
+                12.8 + rng.random() / 10,
+                74.8 + rng.random() / 10,
+                f"Area {rng.randrange(1000)}, Mangaluru",
+                start,
+                start.replace(minute=59),
+                rng.choice(("WALKING", "CYCLING", "BUS", "CAR", "TRAIN")),
+                rng.random() * 20,
+                rng.randrange(4),
+                rng.random() < 0.5,
+            )
+        )
+    return rows
+
+
+@scenario("serialization", False, "CPU to encode /get/trips rows: Pydantic models vs direct JSON")
+async def serialization(ctx: Context) -> List[Result]:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    from baseModel import LocationBase, NatpacResponseBase
+    from routers.getRoutes import _natpac_row
+    from Tools.fastJson import FastJSONResponse
+
+    count = 10000
+    rows = _natpac_rows(count, ctx.rng)
+    field = create_model_field("Response", List[NatpacResponseBase])
+
+    async def through_models() -> bytes:
+        # What /get/trips did before: a model per row, then response_model
+        # validation, jsonable_encoder and JSONResponse.
+        natpac_responses = [
+            NatpacResponseBase(
+                trip_id=row[0],
+                user_id=row[1],
+                user_gender=row[2],
+                user_age=row[3],
+                journey_id=row[4],
+                origin=LocationBase(latitude=row[5], longitude=row[6], name=row[7]),
+                destination=LocationBase(latitude=row[8], longitude=row[9], name=row[10]),
+                start_time=str(row[11]),
+                end_time=str(row[12]),
+                mode=row[13],
+                distance_travelled=row[14],
+                co_travellers=row[15],
+                is_verified_by_user=row[16],
+            )
+            for row in rows
+        ]
+        content = await serialize_response(field=field, response_content=natpac_responses)
+        return JSONResponse(content).body
+
+    async def direct() -> bytes:
+        return FastJSONResponse([_natpac_row(row) for row in rows]).body
+
+    results = []
+    for name, encode in (("pydantic models", through_models), ("direct json", direct)):
+        result = Result(f"serialization: {name} ({count} rows)", unit="run")
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for _ in range(5):
+            begin = time.perf_counter()
+            body = await encode()
+            result.latencies.append(time.perf_counter() - begin)
+        result.elapsed = time.perf_counter() - started
+        cpu = (time.process_time() - cpu_started) / len(result.latencies)
+        result.notes["cpu_ms_per_10k_rows"] = cpu * 1000 * 10000 / count
+        result.notes["bytes"] = len(body)
+        results.append(result)
+    if (await through_models()) != (await direct()):
+        results[1].errors += 1
+        results[1].notes["mismatch"] = "response bodies differ"
+    return results
+
+
+def _tile_of(latitude: float, longitude: float, zoom: int):
+    import math
+
+    n = 1 << zoom
+    phi = math.radians(latitude)
+    return (
+        int((longitude + 180) / 360 * n),
+        int((1 - math.log(math.tan(phi) + 1 / math.cos(phi)) / math.pi) / 2 * n),
+    )
+
+
+@scenario("heatmap", True, "heatmap tiles vs paging through every complaint")
+async def heatmap(ctx: Context) -> List[Result]:
+    from database import engine
+    from Tools.geoCell import geocell
+    from Tools.heatmap import refresh_heatmap
+
+    count = 100000
+    await asyncio.to_thread(reset_database, users=1)
+    rng = random.Random(ctx.args.seed)
+    complaints = [
+        (12.80 + rng.random() * 0.2, 74.75 + rng.random() * 0.2) for _ in range(count)
+    ]
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO complaint (user_id, location_lat, location_lon, geocell, description, category, status) "
+            "SELECT 1, lat, lon, cell, 'pothole', "
+            "(ARRAY['road', 'bus', 'lighting', 'waste'])[1 + c.n %% 4], 'open' "
+            "FROM unnest(%(lat)s, %(lon)s, %(cell)s) WITH ORDINALITY AS c(lat, lon, cell, n)",
+            {
+                "lat": [lat for lat, _ in complaints],
+                "lon": [lon for _, lon in complaints],
+                "cell": [geocell(lat, lon) for lat, lon in complaints],
+            },
+        )
+
+    # What a dashboard downloads today to bin the complaints itself.
+    pages = Result("heatmap: every /get/complaints page", unit="run")
+    started = time.perf_counter()
+    size, cursor = 0, None
+    while True:
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        response = _check(await ctx.client.get("/get/complaints", params=params))
+        size += len(response.content)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    pages.latencies.append(time.perf_counter() - started)
+    pages.elapsed = pages.latencies[0]
+    pages.notes.update(rows=count, bytes=size)
+
+    x, y = _tile_of(12.9, 74.85, 10)
+    path = f"/get/heatmap/complaints/10/{x}/{y}"
+    # Tile reads never count; the first refresh counts every complaint
+    # (the watermark starts at 0).
+    refresh = Result("heatmap: first refresh (counts every row)", unit="run")
+    started = time.perf_counter()
+    await refresh_heatmap()
+    refresh.latencies.append(time.perf_counter() - started)
+    refresh.elapsed = refresh.latencies[0]
+
+    first = Result("heatmap: first tile", unit="run")
+    started = time.perf_counter()
+    response = _check(await ctx.client.get(path))
+    first.latencies.append(time.perf_counter() - started)
+    first.elapsed = first.latencies[0]
+    first.notes.update(bytes=len(response.content), total=response.json()["total"])
+
+    async def read(index: int):
+        _check(await ctx.client.get(path, params={"category": "road"} if index % 2 else {}))
+
+    cached = await run_load(
+        "heatmap: cached tile", read, ctx.args.requests, ctx.args.concurrency
+    )
+    return [pages, refresh, first, cached]
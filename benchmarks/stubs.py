@@ -0,0 +1,185 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+
+# Local stand-ins for Nominatim, OSRM and Gemini so benchmarks are
+# repeatable and never hit the public services. Each stub waits
+# latency_ms (+/- jitter_ms) before answering and counts its requests.
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload, status: int = 200) -> None:
+        self.server.delay()
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self) -> None:
+        with self._lock:
+            self.requests += 1
+        seconds = (self.latency_ms + random.uniform(-1, 1) * self.jitter_ms) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class NominatimHandler(_StubHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/reverse":
+            return self._reply({"error": "not found"}, 404)
+        query = parse_qs(url.query)
+        lat, lon = float(query["lat"][0]), float(query["lon"][0])
+        # One name per ~100 m cell so geocode caching behaves realistically.
+        name = f"Area {lat:.3f},{lon:.3f}"
+        self._reply(
+            {"display_name": f"{name}, Mangaluru, India", "address": {"suburb": name}}
+        )
+
+
+def _haversine_m(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+class OSRMHandler(_StubHandler):
+    # Roads are rarely straight; scale the great-circle distance.
+    DETOUR = 1.3
+
+    def do_GET(self):
+        parts = urlsplit(self.path).path.split("/")
+        # /route/v1/{profile}/{lon,lat;lon,lat;...}
+        if len(parts) != 5 or parts[1] != "route":
+            return self._reply({"code": "InvalidUrl"}, 400)
+        coordinates = [
+            tuple(float(value) for value in pair.split(","))
+            for pair in parts[4].split(";")
+        ]
+        legs = [
+            {"distance": _haversine_m(lat1, lon1, lat2, lon2) * self.DETOUR}
+            for (lon1, lat1), (lon2, lat2) in zip(coordinates, coordinates[1:])
+        ]
+        self._reply(
+            {
+                "code": "Ok",
+                "routes": [{"legs": legs, "distance": sum(l["distance"] for l in legs)}],
+            }
+        )
+
+
+class GeminiHandler(_StubHandler):
+    """generateContent that answers the trace prompt with real segments.
+
+    The last user message of the chat is the JSON list of fixes; it is run
+    through the local segmentation engine so the rest of add_trip sees a
+    realistic answer. Anything else (the system prompt) gets "OK".
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        text = "OK"
+        contents = request.get("contents") or []
+        if contents:
+            parts = contents[-1].get("parts") or [{}]
+            try:
+                records = json.loads(parts[-1].get("text", ""))
+            except ValueError:
+                records = None
+            if isinstance(records, list):
+                text = json.dumps(_segment(records))
+        self._reply(
+            {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [{"text": text}]},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }
+                ]
+            }
+        )
+
+
+def _segment(records):
+    from datetime import datetime
+
+    from Tools.tripSegmentation import segment_trips
+
+    points = [
+        SimpleNamespace(
+            latitude=record["latitude"],
+            longitude=record["longitude"],
+            speed=record["speed"],
+            timestamp=datetime.fromisoformat(str(record["timestamp"])),
+        )
+        for record in records
+    ]
+    trips = segment_trips(points)
+    for trip in trips:
+        for end in ("origin", "destination"):
+            trip[end]["timestamp"] = trip[end]["timestamp"][:19]
+    return trips
+
+
+def start_stubs(latency_ms: float = 0.0, jitter_ms: float = 0.0) -> Dict[str, StubServer]:
+    return {
+        "nominatim": StubServer(NominatimHandler, latency_ms, jitter_ms).start(),
+        "osrm": StubServer(OSRMHandler, latency_ms, jitter_ms).start(),
+        "gemini": StubServer(GeminiHandler, latency_ms, jitter_ms).start(),
+    }
+
+
+def stub_environment(stubs: Dict[str, StubServer]) -> Dict[str, str]:
+    """Settings that point the app at the stubs."""
+    return {
+        "NOMINATIM_URL": stubs["nominatim"].url,
+        "OSRM_URL": stubs["osrm"].url,
+        "GEMINI_API_ENDPOINT": stubs["gemini"].url,
+        "GEMINI_API": "benchmark",
+        # The stubs are local; do not throttle them like the public API.
+        "NOMINATIM_RATE_LIMIT": "100000",
+    }
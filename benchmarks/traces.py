@@ -0,0 +1,121 @@
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Synthetic GPS traces shaped like the app's uploads: a fix every few
+# seconds with the device-reported speed in km/h, GPS noise, the odd
+# position spike, stationary transfers between legs and bus stops.
+
+# Mean and standard deviation of the cruising speed (km/h) and the range
+# of leg durations (minutes) per mode.
+MODE_PROFILES = {
+    "WALKING": (4.5, 0.8, (3, 12)),
+    "CYCLING": (16.0, 3.0, (8, 30)),
+    "BUS": (32.0, 8.0, (10, 40)),
+    "CAR": (48.0, 12.0, (10, 45)),
+    "TRAIN": (85.0, 10.0, (15, 60)),
+}
+COMMUTES = (
+    ("WALKING", "BUS", "WALKING"),
+    ("WALKING", "CAR", "WALKING"),
+    ("CYCLING",),
+    ("WALKING", "TRAIN", "WALKING"),
+    ("WALKING",),
+    ("WALKING", "BUS", "WALKING", "BUS", "WALKING"),
+)
+# Around Mangaluru, where the hand-written requests in test.http point.
+HOME = (12.9141, 74.8560)
+GPS_NOISE_M = 5.0
+SPIKE_PROBABILITY = 0.002
+METRES_PER_DEGREE = 111_320.0
+
+
+def _step(lat: float, lon: float, metres: float, heading: float) -> Tuple[float, float]:
+    dlat = metres * math.cos(heading) / METRES_PER_DEGREE
+    dlon = metres * math.sin(heading) / (METRES_PER_DEGREE * math.cos(math.radians(lat)))
+    return lat + dlat, lon + dlon
+
+
+def commute(
+    user_id: int,
+    start: datetime,
+    rng: random.Random,
+    legs: Optional[Sequence[str]] = None,
+    interval_seconds: float = 10.0,
+    origin: Tuple[float, float] = HOME,
+) -> List[Dict]:
+    """One multi-mode commute as a list of TripRequestBase dicts."""
+    legs = legs or rng.choice(COMMUTES)
+    lat, lon = origin
+    heading = rng.uniform(0, 2 * math.pi)
+    now = start
+    points: List[Dict] = []
+
+    def fix(speed: float) -> None:
+        noisy_lat, noisy_lon = _step(
+            lat, lon, abs(rng.gauss(0, GPS_NOISE_M)), rng.uniform(0, 2 * math.pi)
+        )
+        if rng.random() < SPIKE_PROBABILITY:
+            noisy_lat, noisy_lon = _step(lat, lon, 1500, rng.uniform(0, 2 * math.pi))
+        points.append(
+            {
+                "user_id": user_id,
+                "latitude": round(noisy_lat, 6),
+                "longitude": round(noisy_lon, 6),
+                "speed": round(max(speed, 0.0), 1),
+                "timestamp": now.isoformat(timespec="seconds"),
+            }
+        )
+
+    for index, mode in enumerate(legs):
+        if index:
+            # Transfer: standing still for a couple of minutes.
+            for _ in range(int(rng.uniform(60, 240) / interval_seconds)):
+                fix(abs(rng.gauss(0, 0.3)))
+                now += timedelta(seconds=interval_seconds)
+        mean, std, (low, high) = MODE_PROFILES[mode]
+        steps = int(rng.uniform(low, high) * 60 / interval_seconds)
+        speed = mean
+        stop_left = 0
+        for _ in range(steps):
+            if mode == "BUS" and stop_left == 0 and rng.random() < 0.02:
+                stop_left = int(rng.uniform(20, 60) / interval_seconds)
+            if stop_left:
+                stop_left -= 1
+                speed = abs(rng.gauss(0, 0.5))
+            else:
+                # Mean-reverting speed so it wanders but stays in band.
+                speed += 0.3 * (mean - speed) + rng.gauss(0, std / 3)
+            heading += rng.gauss(0, 0.05)
+            lat, lon = _step(lat, lon, speed / 3.6 * interval_seconds, heading)
+            fix(speed)
+            now += timedelta(seconds=interval_seconds)
+    return points
+
+
+def user_day(
+    user_id: int, day: datetime, rng: random.Random, interval_seconds: float = 10.0
+) -> List[Dict]:
+    """A morning and an evening commute for one user."""
+    morning = day.replace(hour=8) + timedelta(minutes=rng.uniform(0, 90))
+    evening = day.replace(hour=17) + timedelta(minutes=rng.uniform(0, 90))
+    return commute(user_id, morning, rng, interval_seconds=interval_seconds) + commute(
+        user_id, evening, rng, interval_seconds=interval_seconds
+    )
+
+
+def trace_of_length(
+    n: int, user_id: int = 1, seed: int = 0, interval_seconds: float = 5.0
+) -> List[Dict]:
+    """Exactly ``n`` fixes made of back-to-back commutes."""
+    rng = random.Random(seed)
+    points: List[Dict] = []
+    start = datetime(2025, 1, 6, 7)
+    while len(points) < n:
+        points.extend(
+            commute(user_id, start, rng, interval_seconds=interval_seconds)
+        )
+        start = datetime.fromisoformat(points[-1]["timestamp"]) + timedelta(hours=1)
+    return points[:n]
@@ -1,6 +1,14 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from Tools.metrics import instrument_engine
+from Tools.poolMetrics import (
+    InstrumentedAsyncAdaptedQueuePool,
+    InstrumentedQueuePool,
+    instrument_pool,
+)
+
 from dotenv import load_dotenv
 import os
 
@@ -11,21 +19,47 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_NAME = os.getenv("DB_NAME")
 db_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+async_db_url = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+
+# Pool sizing applies to each engine in each worker process, so the
+# database must accept WEB_CONCURRENCY * 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# connections.
+pool_options = dict(
+    pool_pre_ping=True,
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+)
 
-engine = create_engine(url=db_url, pool_pre_ping=True, pool_recycle=1800)
+# Request handlers use the asyncpg engine. The psycopg2 engine stays for
+# code that runs in worker threads or outside the event loop (migrations,
+# background jobs, the geocode cache's persistent tier).
+engine = create_engine(url=db_url, poolclass=InstrumentedQueuePool, **pool_options)
 SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+async_engine = create_async_engine(
+    url=async_db_url, poolclass=InstrumentedAsyncAdaptedQueuePool, **pool_options
+)
+instrument_pool(engine)
+instrument_pool(async_engine.sync_engine)
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+# Attributes stay loaded after commit so no implicit IO happens on access.
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
 Base = declarative_base()
 
 
-def get_database():
-    db = SessionLocal()
+async def get_database():
+    db = AsyncSessionLocal()
     try:
         yield db
     except Exception as e:
         print("Error:", e)
         raise e
     finally:
-        db.close()
+        await db.close()
 
 
 import models
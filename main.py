@@ -1,10 +1,35 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from routers import postRoutes, patchRoutes, getRoutes, deleteRoutes
+from database import AsyncSessionLocal, async_engine, engine
+from routers import postRoutes, patchRoutes, getRoutes, deleteRoutes, internalRoutes
+from Tools.heatmap import start_heatmap_refresher, stop_heatmap_refresher
+from Tools.helperMethods import geocode_cache_stats
+from Tools.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from Tools.modeCache import trip_modes
+from Tools.poolMetrics import POOL_COUNTERS, pool_status
+from Tools.tripJobs import start_trip_workers, stop_trip_workers
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Preload reference data; if the database is not reachable yet the
+    # cache loads itself on first use instead.
+    try:
+        async with AsyncSessionLocal() as db:
+            await trip_modes.load(db)
+    except Exception as e:
+        print("Error:", e)
+    workers = start_trip_workers()
+    refresher = start_heatmap_refresher()
+    yield
+    await stop_heatmap_refresher(refresher)
+    await stop_trip_workers(workers)
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -14,9 +39,84 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Paged list endpoints return the next page's cursor in this header.
+    expose_headers=[getRoutes.NEXT_CURSOR_HEADER],
 )
+# Added last so it is outermost and also times CORS handling.
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 
 app.include_router(router=postRoutes.router)
 app.include_router(router=patchRoutes.router)
 app.include_router(router=getRoutes.router)
 app.include_router(router=deleteRoutes.router)
+app.include_router(router=internalRoutes.router)
+
+
+def _pool_metrics():
+    pools = {
+        "async": pool_status(async_engine.sync_engine),
+        "sync": pool_status(engine),
+    }
+    for key in pools["sync"]:
+        name, kind = f"db_pool_{key}", "gauge"
+        if key in POOL_COUNTERS:
+            kind = "counter"
+            if not name.endswith("_total"):
+                name += "_total"
+        yield (
+            name,
+            kind,
+            f"Connection pool {key.replace('_', ' ')}.",
+            [({"engine": name}, status[key]) for name, status in pools.items()],
+        )
+
+
+registry.register_collector(_pool_metrics)
+
+# geocode_cache_stats() keys exported as counters, with their documentation;
+# size and maxsize are gauges.
+GEOCODE_COUNTERS = {
+    "hits": "Reverse geocoding lookups answered by the in-process cache.",
+    "misses": "Reverse geocoding lookups missing the in-process cache.",
+    "evictions": "Entries evicted from the in-process geocode cache.",
+    "db_hits": "Geocode cells found in the geocode_cache table.",
+    "db_misses": "Geocode cells missing from the geocode_cache table.",
+    "remote_lookups": "Reverse geocoding requests sent to Nominatim.",
+    "deduplicated": "Concurrent lookups of a cell that shared another's result.",
+}
+
+
+def _geocode_metrics():
+    stats = geocode_cache_stats()
+    for key, documentation in GEOCODE_COUNTERS.items():
+        yield (
+            f"geocode_cache_{key}_total",
+            "counter",
+            documentation,
+            [({}, stats[key])],
+        )
+    yield (
+        "geocode_cache_size",
+        "gauge",
+        "Entries in the in-process geocode cache.",
+        [({}, stats["size"])],
+    )
+    yield (
+        "geocode_cache_maxsize",
+        "gauge",
+        "Capacity of the in-process geocode cache.",
+        [({}, stats["maxsize"])],
+    )
+
+
+registry.register_collector(_geocode_metrics)
+
+
+# Served behind the same bearer token as /internal/*.
+@app.get(
+    "/metrics",
+    include_in_schema=False,
+    dependencies=[Depends(internalRoutes.require_internal_token)],
+)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
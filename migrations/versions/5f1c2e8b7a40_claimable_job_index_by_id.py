@@ -0,0 +1,30 @@
+"""claimable job index by id
+
+Revision ID: 5f1c2e8b7a40
+Revises: e3a9d07c5b18
+Create Date: 2026-10-18 18:41:12.530127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2e8b7a40'
+down_revision: Union[str, Sequence[str], None] = 'e3a9d07c5b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('ix_trip_inference_job_claimable', table_name='trip_inference_job', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_trip_inference_job_claimable', 'trip_inference_job', ['id'], unique=False, postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trip_inference_job_claimable', table_name='trip_inference_job', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_trip_inference_job_claimable', 'trip_inference_job', ['status', 'id'], unique=False, postgresql_where=sa.text("status IN ('queued', 'running')"))
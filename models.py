@@ -1,4 +1,5 @@
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -6,6 +7,8 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
+    LargeBinary,
     func,
 )
 from sqlalchemy.orm import relationship
@@ -94,6 +97,16 @@ class Trip(Base):
     )
     trip_journey = relationship("Journey", back_populates="trips")
 
+    __table_args__ = (
+        Index(
+            "ix_trip_user_id_mode_id",
+            "user_id",
+            "mode_id",
+            postgresql_include=["distance_travelled"],
+        ),
+        Index("ix_trip_journey_id", "journey_id"),
+    )
+
 
 class Journey(Base):
     __tablename__ = "journey"
@@ -108,6 +121,23 @@ class Journey(Base):
     
     trips = relationship("Trip", back_populates="trip_journey")
 
+    __table_args__ = (
+        Index("ix_journey_user_id_start_time", "user_id", "start_time", "id"),
+        Index("ix_journey_start_time", "start_time", "id"),
+    )
+
+
+class JourneyTrace(Base):
+    __tablename__ = "journey_trace"
+    journey_id = Column(
+        Integer, ForeignKey("journey.id", ondelete="CASCADE"), primary_key=True
+    )
+    point_count = Column(Integer, nullable=False)
+    raw_point_count = Column(Integer, nullable=False)
+    tolerance_m = Column(Float, nullable=False)
+    # Encoded with Tools.trajectory.encode_trace.
+    trace = Column(LargeBinary, nullable=False)
+
 
 class Complaint(Base):
     __tablename__ = "complaint"
@@ -115,6 +145,8 @@ class Complaint(Base):
     user_id = Column(Integer, ForeignKey("user.id"))
     location_lat = Column(Float, nullable=False)
     location_lon = Column(Float, nullable=False)
+    # Integer geohash of the location (Tools/geoCell.py) for spatial lookups.
+    geocell = Column(BigInteger, index=True)
     description = Column(String, nullable=False)
     category = Column(String)
     timestamp = Column(DateTime, default=func.now())
@@ -131,4 +163,88 @@ class DataCollector(Base):
     longitude = Column(Float, nullable=False)
     speed = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=func.now())
-    is_used = Column(Boolean, default=False)
\ No newline at end of file
+    is_used = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Only unconsumed fixes are ever searched, so the index skips the
+        # (much larger) set of rows already turned into trips.
+        Index(
+            "ix_data_collector_user_id_timestamp_unused",
+            "user_id",
+            "timestamp",
+            postgresql_where=is_used.is_(False),
+        ),
+    )
+
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+    cell = Column(String, primary_key=True)
+    location_name = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class TripInferenceJob(Base):
+    __tablename__ = "trip_inference_job"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("user.id"))
+    cutoff = Column(DateTime, nullable=False)
+    classifier = Column(String)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    journey_id = Column(Integer, ForeignKey("journey.id", ondelete="SET NULL"))
+    error = Column(String)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Workers claim the oldest claimable job; indexing only those rows
+        # by id keeps the claim from walking past every finished job.
+        Index(
+            "ix_trip_inference_job_claimable",
+            "id",
+            postgresql_where=status.in_(["queued", "running"]),
+        ),
+    )
+
+
+# Maintained by Tools.heatmap: points of a layer counted per map tile of
+# HEATMAP_BASE_ZOOM, up to the layer's watermark.
+class HeatmapBin(Base):
+    __tablename__ = "heatmap_bin"
+    layer = Column(String, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    # Complaint category or trip mode; "" when there is none.
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+class HeatmapWatermark(Base):
+    __tablename__ = "heatmap_watermark"
+    layer = Column(String, primary_key=True)
+    # Source rows with ids up to this one are counted in heatmap_bin.
+    last_id = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(DateTime)
+
+
+# Maintained by Tools.odMatrix: trips of existing journeys per origin zone,
+# destination zone, mode and hour of the start time.
+class ODFlow(Base):
+    __tablename__ = "od_flow"
+    origin_zone = Column(BigInteger, primary_key=True)
+    destination_zone = Column(BigInteger, primary_key=True)
+    mode_id = Column(Integer, ForeignKey("trip_mode.id"), primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    trip_count = Column(Integer, nullable=False)
+    distance_km = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_od_flow_destination_zone", "destination_zone"),)
+
+
+# One row per rate limit shared across processes (see Tools.rateLimit):
+# the earliest time the next call may be made.
+class RateLimit(Base):
+    __tablename__ = "rate_limit"
+    name = Column(String, primary_key=True)
+    next_at = Column(DateTime(timezone=True), nullable=False)
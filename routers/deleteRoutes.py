@@ -1,22 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Annotated, List
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import and_, select
 
 from database import get_database
 from models import Journey
+from Tools.heatmap import forget_journey, invalidate_heatmap
+from Tools.modeShare import invalidate_mode_share
+from Tools.odMatrix import invalidate_od_matrix, remove_journey_flows
 
 
-db_dependency = Annotated[Session, Depends(get_database)]
+db_dependency = Annotated[AsyncSession, Depends(get_database)]
 router = APIRouter(prefix="/delete", tags=["delete"])
 
 
 @router.delete("/delete_journey")
-def delete_journey(journey_id: int, db: db_dependency):
+async def delete_journey(journey_id: int, db: db_dependency):
     """Delete all trips associated with a journey_id for a specific user"""
     try:
         stmt = select(Journey).where(Journey.id == journey_id)
-        journey = db.execute(stmt).scalars().first()
+        journey = (await db.execute(stmt)).scalars().first()
         
         if not journey:
             raise HTTPException(
@@ -24,12 +27,17 @@ def delete_journey(journey_id: int, db: db_dependency):
                 detail=f"No journey found with journey_id {journey_id}"
             )
             
-        db.delete(journey)
-        db.commit()
+        await forget_journey(db, journey_id)
+        await remove_journey_flows(db, journey_id)
+        await db.delete(journey)
+        await db.commit()
+        invalidate_mode_share()
+        invalidate_heatmap()
+        invalidate_od_matrix()
         return {"message": f"Journey {journey_id} deleted successfully"}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}"
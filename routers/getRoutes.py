@@ -1,13 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Annotated, List
-from sqlalchemy.orm import Session
-from sqlalchemy import select, and_, func
-
-from database import get_database
-from models import User, Trip, TripMode, Journey, Complaint
-from baseModel import JourneyBase, NatpacResponseBase, LocationBase, ComplaintBase
-
-db_dependency = Annotated[Session, Depends(get_database)]
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Annotated, AsyncIterator, List, Literal, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy import select, and_, or_, func, tuple_
+
+from database import AsyncSessionLocal, get_database
+from models import (
+    User,
+    Trip,
+    TripMode,
+    Journey,
+    Complaint,
+    LocationPoints,
+    TripInferenceJob,
+    JourneyTrace,
+)
+from baseModel import (
+    JourneyBase,
+    NatpacResponseBase,
+    ComplaintBase,
+    NearbyComplaintBase,
+)
+from Tools.fastJson import FastJSONResponse
+from Tools.geoCell import (
+    EARTH_RADIUS_M,
+    cell_ranges,
+    distance_m,
+    radius_bbox,
+    zone_bounds,
+)
+from Tools.heatmap import HEATMAP_BASE_ZOOM, heatmap_tile
+from Tools.modeCache import trip_modes
+from Tools.modeShare import mode_share
+from Tools.odMatrix import OD_ZONE_BITS, od_flows, od_matrix
+from Tools.pagination import decode_cursor, encode_cursor
+from Tools.timestamps import Timestamp
+from Tools.trajectory import decode_trace
+
+db_dependency = Annotated[AsyncSession, Depends(get_database)]
 router = APIRouter(prefix="/get", tags=["get"])
 
 # # CO2 emission factors in kg CO2 per km for different modes
@@ -81,160 +117,603 @@ router = APIRouter(prefix="/get", tags=["get"])
 
 
 @router.get("/user/streak")
-def get_user_streak(user_id: int, db: db_dependency):
+async def get_user_streak(user_id: int, db: db_dependency):
     stmt = select(User).where(User.id == user_id)
-    user = db.execute(stmt).scalars().first()
+    user = (await db.execute(stmt)).scalars().first()
     return {"streak": user.streak}
 
 
-@router.get("/user/distance/{mode}")
-def get_user_distance_travelled(user_id: int, mode: str, db: db_dependency):
-    stmt = select(TripMode).where(TripMode.mode_name == mode.upper())
-    mode = db.execute(stmt).scalars().first()
-    stmt = select(Trip).where(and_(Trip.user_id == user_id, Trip.mode_id == mode.id))
-    trips = db.execute(stmt).scalars().all()
+@router.get("/user/distance")
+async def get_user_distance_by_mode(
+    user_id: int,
+    db: db_dependency,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+):
+    """Distance travelled per mode, optionally limited to trips started in [start, end)"""
+    stmt = (
+        select(Trip.mode_id, func.sum(Trip.distance_travelled))
+        .where(Trip.user_id == user_id)
+        .group_by(Trip.mode_id)
+    )
+    if start is not None:
+        stmt = stmt.where(Trip.start_time >= start)
+    if end is not None:
+        stmt = stmt.where(Trip.start_time < end)
+    totals = dict((await db.execute(stmt)).all())
+
+    distance_travelled = {
+        name: totals.get(mode_id, 0.0)
+        for mode_id, name in (await trip_modes.names(db)).items()
+    }
+    return {"distance_travelled": distance_travelled}
 
-    total_distance_travelled = 0
-    if trips:
-        for trip in trips:
-            total_distance_travelled += trip.distance_travelled
+
+@router.get("/user/distance/{mode}")
+async def get_user_distance_travelled(
+    user_id: int, mode: str, db: db_dependency
+):
+    mode_id = await trip_modes.id_for(db, mode)
+    if mode_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Mode {mode.upper()} not found",
+        )
+    stmt = select(func.coalesce(func.sum(Trip.distance_travelled), 0.0)).where(
+        and_(Trip.user_id == user_id, Trip.mode_id == mode_id)
+    )
+    total_distance_travelled = (await db.execute(stmt)).scalar_one()
 
     return {"distance_travelled": total_distance_travelled}
 
 
-@router.get("/user/journey", response_model=List[JourneyBase])
-def get_all_journeys(user_id: int, db: db_dependency):
-    stmt = select(Journey).where(Journey.user_id == user_id)
-    journeys = db.execute(stmt).scalars().all()
-    list_of_journeys = []
-
-    for journey in journeys:
-        journey_data = JourneyBase(
-            id=journey.id,
-            origin=journey.origin,
-            destination=journey.destination,
-            start_time=str(journey.start_time),
-            end_time=str(journey.end_time),
-            purpose=journey.purpose,
-            is_verified_by_user=journey.is_verified_by_user,
+# List endpoints return one page, newest first. When more rows exist the
+# X-Next-Cursor response header carries an opaque token for the next page.
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+limit_query = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+
+
+def _cursor_values(cursor: str, *types: type) -> list:
+    try:
+        return decode_cursor(cursor, *types)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _paginate(rows, limit: int, key, response: Response) -> list:
+    """Trim the look-ahead row and expose the next cursor if there was one."""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+
+def _json_page(records: list, response: Response) -> FastJSONResponse:
+    """Encode a page of plain records, keeping headers set on ``response``.
+
+    A returned Response bypasses response_model, so records must already
+    have the model's fields and types; it still documents the schema.
+    """
+    return FastJSONResponse(records, headers=dict(response.headers))
+
+
+async def _journey_page(
+    db: AsyncSession,
+    response: Response,
+    limit: int,
+    cursor: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    verified: Optional[bool],
+    *filters,
+) -> FastJSONResponse:
+    """One keyset page of journeys ordered by (start_time, id) descending."""
+    stmt = select(*JOURNEY_COLUMNS).where(*filters)
+    if start is not None:
+        stmt = stmt.where(Journey.start_time >= start)
+    if end is not None:
+        stmt = stmt.where(Journey.start_time < end)
+    if verified is not None:
+        stmt = stmt.where(Journey.is_verified_by_user.is_(verified))
+    if cursor:
+        start_time, journey_id = _cursor_values(cursor, datetime, int)
+        stmt = stmt.where(
+            tuple_(Journey.start_time, Journey.id) < tuple_(start_time, journey_id)
         )
-        list_of_journeys.append(journey_data)
+    stmt = stmt.order_by(Journey.start_time.desc(), Journey.id.desc()).limit(
+        limit + 1
+    )
+    journeys = _paginate(
+        await db.execute(stmt), limit, lambda row: (row[3], row[0]), response
+    )
+    return _json_page([_journey_row(row) for row in journeys], response)
+
 
-    return list_of_journeys
+@router.get("/user/journey", response_model=List[JourneyBase])
+async def get_all_journeys(
+    user_id: int,
+    db: db_dependency,
+    response: Response,
+    limit: int = limit_query,
+    cursor: Optional[str] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    verified: Optional[bool] = None,
+):
+    return await _journey_page(
+        db, response, limit, cursor, start, end, verified, Journey.user_id == user_id
+    )
 
 
 @router.get("/journey", response_model=List[JourneyBase])
-def get_all_journeys_for_NATPAC(db: db_dependency):
-    stmt = select(Journey)
-    journeys = db.execute(stmt).scalars().all()
-    list_of_journeys = []
-
-    for journey in journeys:
-        journey_data = JourneyBase(
-            id=journey.id,
-            origin=journey.origin,
-            destination=journey.destination,
-            start_time=str(journey.start_time),
-            end_time=str(journey.end_time),
-            purpose=journey.purpose,
-            is_verified_by_user=journey.is_verified_by_user,
+async def get_all_journeys_for_NATPAC(
+    db: db_dependency,
+    response: Response,
+    limit: int = limit_query,
+    cursor: Optional[str] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    verified: Optional[bool] = None,
+):
+    return await _journey_page(db, response, limit, cursor, start, end, verified)
+
+
+def _natpac_trips_stmt():
+    """All trips joined with everything NatpacResponseBase needs, as columns.
+
+    Trips whose user, mode, journey or locations are missing are skipped.
+    """
+    origin = aliased(LocationPoints)
+    destination = aliased(LocationPoints)
+    return (
+        select(
+            Trip.id,
+            Trip.user_id,
+            User.gender,
+            User.age,
+            Trip.journey_id,
+            origin.latitude,
+            origin.longitude,
+            origin.location_name,
+            destination.latitude,
+            destination.longitude,
+            destination.location_name,
+            Trip.start_time,
+            Trip.end_time,
+            TripMode.mode_name,
+            Trip.distance_travelled,
+            Trip.co_travellers,
+            Journey.is_verified_by_user,
         )
-        list_of_journeys.append(journey_data)
-
-    return list_of_journeys
+        .join(User, User.id == Trip.user_id)
+        .join(TripMode, TripMode.id == Trip.mode_id)
+        .join(Journey, Journey.id == Trip.journey_id)
+        .join(origin, origin.id == Trip.origin_location_id)
+        .join(destination, destination.id == Trip.destination_location_id)
+        .order_by(Trip.id)
+    )
 
 
 @router.get("/trips", response_model=List[NatpacResponseBase])
-def get_all_trips(db: db_dependency):
-    stmt = select(Trip)
-    trips = db.execute(stmt).scalars().all()
-    natpac_responses = []
-
-    for trip in trips:
-        origin_base = LocationBase(
-            latitude=trip.origin_location.latitude,
-            longitude=trip.origin_location.longitude,
-            name=trip.origin_location.location_name,
-        )
-        dest_base = LocationBase(
-            latitude=trip.destination_location.latitude,
-            longitude=trip.destination_location.longitude,
-            name=trip.destination_location.location_name,
+async def get_all_trips(db: db_dependency):
+    rows = await db.execute(_natpac_trips_stmt())
+    return FastJSONResponse([_natpac_row(row) for row in rows])
+
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Rows of these records are projected columns, in the order the builders
+# below expect; the list endpoints and the exports share them.
+JOURNEY_COLUMNS = (
+    Journey.id,
+    Journey.origin,
+    Journey.destination,
+    Journey.start_time,
+    Journey.end_time,
+    Journey.purpose,
+    Journey.is_verified_by_user,
+)
+COMPLAINT_COLUMNS = (
+    Complaint.id,
+    Complaint.location_lat,
+    Complaint.location_lon,
+    Complaint.description,
+    Complaint.category,
+    Complaint.timestamp,
+    Complaint.status,
+)
+
+
+def _natpac_row(row) -> dict:
+    return {
+        "trip_id": row[0],
+        "user_id": row[1],
+        "user_gender": row[2],
+        "user_age": row[3],
+        "journey_id": row[4],
+        "origin": {"latitude": row[5], "longitude": row[6], "name": row[7]},
+        "destination": {"latitude": row[8], "longitude": row[9], "name": row[10]},
+        "start_time": str(row[11]),
+        "end_time": str(row[12]),
+        "mode": row[13],
+        "distance_travelled": row[14],
+        "co_travellers": row[15],
+        "is_verified_by_user": row[16],
+    }
+
+
+def _journey_row(row) -> dict:
+    return {
+        "id": row[0],
+        "origin": row[1],
+        "destination": row[2],
+        "start_time": str(row[3]),
+        "end_time": str(row[4]),
+        "purpose": row[5],
+        "is_verified_by_user": row[6],
+    }
+
+
+def _complaint_row(row) -> dict:
+    # user_id has always carried the complaint id on this endpoint.
+    return {
+        "user_id": row[0],
+        "location_lat": row[1],
+        "location_lon": row[2],
+        "description": row[3],
+        "category": row[4],
+        "timestamp": str(row[5]),
+        "status": row[6],
+    }
+
+
+def _flatten(record: dict) -> dict:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}_{sub_key}"] = sub_value
+        else:
+            flat[key] = value
+    return flat
+
+
+async def _stream_export(stmt, to_record, format: str) -> AsyncIterator[bytes]:
+    """Encode query rows as they come off a server-side cursor.
+
+    The generator owns its session because the request's session is closed
+    before a streaming body has been sent.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)
         )
+        fieldnames = None
+        async for rows in result.partitions():
+            if format == "csv":
+                buffer = io.StringIO()
+                records = [_flatten(to_record(row)) for row in rows]
+                writer = csv.DictWriter(
+                    buffer, fieldnames=fieldnames or list(records[0])
+                )
+                if fieldnames is None:
+                    fieldnames = writer.fieldnames
+                    writer.writeheader()
+                writer.writerows(records)
+                yield buffer.getvalue().encode("utf-8")
+            else:
+                yield "".join(
+                    json.dumps(to_record(row)) + "\n" for row in rows
+                ).encode("utf-8")
+
+
+@router.get("/trips/export")
+async def export_all_trips(format: Literal["ndjson", "csv"] = "ndjson"):
+    """Stream every NATPAC trip as NDJSON or CSV without buffering the table"""
+    return StreamingResponse(
+        _stream_export(_natpac_trips_stmt(), _natpac_row, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+    )
 
-        natpac = NatpacResponseBase(
-            trip_id=trip.id,
-            user_id=trip.user_id,
-            user_gender=trip.user.gender,
-            user_age=trip.user.age,
-            journey_id=trip.journey_id,
-            origin=origin_base,
-            destination=dest_base,
-            start_time=str(trip.start_time),
-            end_time=str(trip.end_time),
-            mode=trip.mode.mode_name,
-            distance_travelled=trip.distance_travelled,
-            co_travellers=trip.co_travellers,
-            is_verified_by_user=trip.trip_journey.is_verified_by_user,
-        )
-        natpac_responses.append(natpac)
 
-    return natpac_responses
+@router.get("/journey/export")
+async def export_all_journeys(format: Literal["ndjson", "csv"] = "ndjson"):
+    """Stream every journey as NDJSON or CSV without buffering the table"""
+    stmt = select(*JOURNEY_COLUMNS).order_by(Journey.id)
+    return StreamingResponse(
+        _stream_export(stmt, _journey_row, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+    )
+
+
+@router.get("/journey/{journey_id}/trace")
+async def get_journey_trace(journey_id: int, db: db_dependency):
+    """Simplified GPS trace of a journey, if one was stored"""
+    journey_trace = await db.get(JourneyTrace, journey_id)
+    if journey_trace is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No trace stored for journey {journey_id}",
+        )
+    return {
+        "journey_id": journey_trace.journey_id,
+        "tolerance_m": journey_trace.tolerance_m,
+        "raw_point_count": journey_trace.raw_point_count,
+        "points": decode_trace(journey_trace.trace),
+    }
+
+
+@router.get("/trip/job/{job_id}")
+async def get_trip_job(job_id: int, db: db_dependency):
+    """Status of a queued trip inference; includes the journey once done"""
+    job = await db.get(TripInferenceJob, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trip job {job_id} not found",
+        )
+    result = {"job_id": job.id, "status": job.status, "error": job.error}
+    if job.journey_id is not None:
+        journey = await db.get(Journey, job.journey_id)
+        if journey is not None:
+            result["journey"] = JourneyBase(
+                id=journey.id,
+                origin=journey.origin,
+                destination=journey.destination,
+                start_time=str(journey.start_time),
+                end_time=str(journey.end_time),
+                purpose=journey.purpose,
+                is_verified_by_user=journey.is_verified_by_user,
+            )
+    return result
+
+
+@router.get("/percentage")
+async def percentage_of_all_modes():
+    """Share of trips per mode and of verified trips, from one cached aggregate"""
+    return await mode_share()
 
 
 @router.get("/percentage/verified_trips")
-def percentage_of_verified_trips(db: db_dependency):
-    stmt = select(func.count()).select_from(Trip)
-    total_count = db.execute(stmt).scalar_one()
-    stmt = (
-        select(func.count())
-        .select_from(Trip)
-        .join(Journey, Journey.id == Trip.journey_id)
-        .where(Journey.is_verified_by_user.is_((True)))
+async def percentage_of_verified_trips():
+    return {"Percentage": (await mode_share())["verified_trips"]}
+
+
+@router.get("/percentage/{mode_name}")
+async def percentage_of_mode(mode_name: str):
+    summary = await mode_share()
+    return {"Percentage": summary["modes"].get(mode_name.upper(), 0.0)}
+
+
+async def _complaint_page(
+    db: AsyncSession,
+    response: Response,
+    limit: int,
+    cursor: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    category: Optional[str],
+    complaint_status: Optional[str],
+    *filters,
+) -> FastJSONResponse:
+    """One keyset page of complaints ordered by id descending."""
+    stmt = select(*COMPLAINT_COLUMNS).where(*filters)
+    if start is not None:
+        stmt = stmt.where(Complaint.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(Complaint.timestamp < end)
+    if category is not None:
+        stmt = stmt.where(Complaint.category == category)
+    if complaint_status is not None:
+        stmt = stmt.where(Complaint.status == complaint_status)
+    if cursor:
+        (complaint_id,) = _cursor_values(cursor, int)
+        stmt = stmt.where(Complaint.id < complaint_id)
+    # Complaint ids grow with time, and unlike timestamp they are never null.
+    stmt = stmt.order_by(Complaint.id.desc()).limit(limit + 1)
+    complaints = _paginate(
+        await db.execute(stmt), limit, lambda row: (row[0],), response
     )
-    true_count = db.execute(stmt).scalar_one()
+    return _json_page([_complaint_row(row) for row in complaints], response)
 
-    if total_count == 0:
-        return {"Percentage": 0.0}
 
-    return {"Percentage": (true_count / total_count) * 100}
+@router.get("/complaints", response_model=List[ComplaintBase])
+async def get_all_complaints(
+    db: db_dependency,
+    response: Response,
+    limit: int = limit_query,
+    cursor: Optional[str] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    category: Optional[str] = None,
+    complaint_status: Optional[str] = Query(None, alias="status"),
+):
+    return await _complaint_page(
+        db, response, limit, cursor, start, end, category, complaint_status
+    )
 
 
-@router.get("/percentage/{mode_name}")
-def percentage_of_mode(mode_name: str, db: db_dependency):
-    stmt = select(func.count()).select_from(Trip)
-    total_count = db.execute(stmt).scalar_one()
-    stmt = (
-        select(func.count())
-        .select_from(Trip)
-        .join(TripMode, TripMode.id == Trip.mode_id)
-        .where(TripMode.mode_name == mode_name.upper())
+# Spatial lookups go through the indexed Complaint.geocell column: a box
+# is covered by a few cell ranges (Tools/geoCell.py), and only rows in
+# those ranges are checked against the exact box or distance.
+MAX_RADIUS_M = 50000
+# k-nearest searches a circle of this radius first and widens it by
+# NEAREST_GROWTH until it holds k complaints or covers the globe.
+NEAREST_START_RADIUS_M = 500
+NEAREST_GROWTH = 4
+
+
+def _in_bbox(south: float, west: float, north: float, east: float):
+    ranges = cell_ranges(south, west, north, east)
+    if west > east:
+        longitude = or_(Complaint.location_lon >= west, Complaint.location_lon <= east)
+    else:
+        longitude = Complaint.location_lon.between(west, east)
+    return and_(
+        or_(*(Complaint.geocell.between(low, high) for low, high in ranges)),
+        Complaint.location_lat.between(south, north),
+        longitude,
     )
-    mode_count = db.execute(stmt).scalar_one()
 
-    if total_count == 0:
-        return {"Percentage": 0.0}
 
-    return {"Percentage": (mode_count / total_count) * 100}
+async def _complaints_within(
+    db: AsyncSession,
+    latitude: float,
+    longitude: float,
+    radius_m: float,
+    limit: int,
+    category: Optional[str],
+    complaint_status: Optional[str],
+) -> list:
+    """Up to ``limit`` complaints within ``radius_m``, nearest first."""
+    distance = distance_m(Complaint.location_lat, Complaint.location_lon, latitude, longitude)
+    stmt = select(*COMPLAINT_COLUMNS, distance).where(
+        _in_bbox(*radius_bbox(latitude, longitude, radius_m)), distance <= radius_m
+    )
+    if category is not None:
+        stmt = stmt.where(Complaint.category == category)
+    if complaint_status is not None:
+        stmt = stmt.where(Complaint.status == complaint_status)
+    stmt = stmt.order_by(distance, Complaint.id).limit(limit)
+    return (await db.execute(stmt)).all()
+
+
+def _nearby_row(row) -> dict:
+    record = _complaint_row(row)
+    record["distance_m"] = round(row[7], 1)
+    return record
+
+
+@router.get("/complaints/bbox", response_model=List[ComplaintBase])
+async def get_complaints_in_bbox(
+    db: db_dependency,
+    response: Response,
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    limit: int = limit_query,
+    cursor: Optional[str] = None,
+    start: Optional[Timestamp] = None,
+    end: Optional[Timestamp] = None,
+    category: Optional[str] = None,
+    complaint_status: Optional[str] = Query(None, alias="status"),
+):
+    """Complaints inside a viewport, newest first; west > east crosses the antimeridian"""
+    if south > north:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"south ({south}) must not be north of north ({north})",
+        )
+    return await _complaint_page(
+        db,
+        response,
+        limit,
+        cursor,
+        start,
+        end,
+        category,
+        complaint_status,
+        _in_bbox(south, west, north, east),
+    )
 
 
-@router.get("/complaints", response_model=List[ComplaintBase])
-def get_all_complaints(db: db_dependency):
-    complaints = []
-
-    stmt = select(Complaint)
-    _complaints = db.execute(stmt).scalars().all()
-
-    for _complaint in _complaints:
-        complaint = ComplaintBase(
-            user_id=_complaint.id,
-            location_lat=_complaint.location_lat,
-            location_lon=_complaint.location_lon,
-            description=_complaint.description,
-            category=_complaint.category,
-            timestamp=str(_complaint.timestamp),
-            status=_complaint.status,
+@router.get("/complaints/nearby", response_model=List[NearbyComplaintBase])
+async def get_complaints_nearby(
+    db: db_dependency,
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=MAX_RADIUS_M),
+    limit: int = limit_query,
+    category: Optional[str] = None,
+    complaint_status: Optional[str] = Query(None, alias="status"),
+):
+    """Complaints within radius_m metres of a point, nearest first"""
+    rows = await _complaints_within(
+        db, latitude, longitude, radius_m, limit, category, complaint_status
+    )
+    return FastJSONResponse([_nearby_row(row) for row in rows])
+
+
+@router.get("/complaints/nearest", response_model=List[NearbyComplaintBase])
+async def get_nearest_complaints(
+    db: db_dependency,
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    complaint_status: Optional[str] = Query(None, alias="status"),
+):
+    """The k complaints closest to a point, nearest first"""
+    radius_m = NEAREST_START_RADIUS_M
+    while True:
+        rows = await _complaints_within(
+            db, latitude, longitude, radius_m, k, category, complaint_status
+        )
+        # Every complaint within radius_m was considered, so once k are
+        # found no complaint outside the circle can be closer.
+        if len(rows) == k or radius_m >= math.pi * EARTH_RADIUS_M:
+            return FastJSONResponse([_nearby_row(row) for row in rows])
+        radius_m *= NEAREST_GROWTH
+
+
+@router.get("/heatmap/{layer}/{z}/{x}/{y}")
+async def get_heatmap_tile(
+    layer: Literal["complaints", "origins", "destinations"],
+    z: int,
+    x: int,
+    y: int,
+    category: Optional[str] = None,
+):
+    """Counts per bin of a z/x/y map tile of complaints or trip origins/destinations.
+
+    category filters complaints by category and trips by mode.
+    """
+    if not 0 <= z <= HEATMAP_BASE_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No tile {z}/{x}/{y}; zoom goes up to {HEATMAP_BASE_ZOOM}",
+        )
+    if category is not None and layer != "complaints":
+        category = category.upper()
+    return await heatmap_tile(layer, z, x, y, category)
+
+
+@router.get("/od")
+async def get_od_matrix(
+    db: db_dependency,
+    origin_zone: Optional[int] = None,
+    destination_zone: Optional[int] = None,
+):
+    """Origin-destination flows: trips and distance per zone pair, mode and hour.
+
+    The whole matrix is served from a cached encoding; origin_zone and
+    destination_zone narrow it to the flows leaving or entering a zone.
+    """
+    if origin_zone is None and destination_zone is None:
+        return Response(await od_matrix(), media_type="application/json")
+    return FastJSONResponse(await od_flows(db, origin_zone, destination_zone))
+
+
+@router.get("/od/zone/{zone}")
+async def get_od_zone(zone: int):
+    """Bounding box of an OD zone"""
+    if not 0 <= zone < 1 << (2 * OD_ZONE_BITS):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Zone {zone} not found",
         )
-        complaints.append(complaint)
-    
-    return complaints
+    south, west, north, east = zone_bounds(zone, OD_ZONE_BITS)
+    return {
+        "zone": zone,
+        "zone_bits": OD_ZONE_BITS,
+        "south": south,
+        "west": west,
+        "north": north,
+        "east": east,
+    }
@@ -0,0 +1,44 @@
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from database import async_engine, engine
+from Tools.poolMetrics import pool_status
+
+
+# /internal/* and /metrics expose process internals, so they are only
+# served when INTERNAL_API_TOKEN is set, and then only to requests that
+# send it as "Authorization: Bearer <token>".
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+
+async def require_internal_token(authorization: Optional[str] = Header(None)):
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {INTERNAL_API_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid internal API token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    dependencies=[Depends(require_internal_token)],
+    include_in_schema=False,
+)
+
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """Occupancy, checkout wait and timeout counters of both connection pools"""
+    return {
+        "async": pool_status(async_engine.sync_engine),
+        "sync": pool_status(engine),
+    }
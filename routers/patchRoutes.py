@@ -1,26 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Annotated
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from database import get_database
 from models import User, Journey
+from routers.internalRoutes import require_internal_token
+from Tools.modeCache import trip_modes
+from Tools.modeShare import invalidate_mode_share
 
 
 router = APIRouter(prefix="/update", tags=["update"])
-db_dependency = Annotated[Session, Depends(get_database)]
+db_dependency = Annotated[AsyncSession, Depends(get_database)]
 
 
 @router.patch("/increment_streak")
-def daily_streak(user_id: int, db: db_dependency):
+async def daily_streak(user_id: int, db: db_dependency):
     stmt = select(User).where(User.id == user_id)
-    user = db.execute(stmt).scalars().first()
+    user = (await db.execute(stmt)).scalars().first()
     user.streak += 1
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occured: {str(e)}",
@@ -28,18 +31,19 @@ def daily_streak(user_id: int, db: db_dependency):
 
 
 @router.patch("/verify_journey")
-def verify_journey(journey_id: int, db: db_dependency):
+async def verify_journey(journey_id: int, db: db_dependency):
     """Update is_verified_by_user flag for all trips in a journey"""
     try:
         stmt = select(Journey).where(Journey.id == journey_id)
-        journey = db.execute(stmt).scalars().first()
+        journey = (await db.execute(stmt)).scalars().first()
         journey.is_verified_by_user = True
 
-        db.commit()
+        await db.commit()
+        invalidate_mode_share()
         return {"message": f"Journey {journey_id} verified successfully"}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
@@ -47,18 +51,41 @@ def verify_journey(journey_id: int, db: db_dependency):
 
 
 @router.patch("/journey_purpose")
-def update_purpose(journey_id: int, purpose: str, db: db_dependency):
+async def update_purpose(journey_id: int, purpose: str, db: db_dependency):
 
     try:
         stmt = select(Journey).where(Journey.id == journey_id)
-        journey = db.execute(stmt).scalars().first()
+        journey = (await db.execute(stmt)).scalars().first()
         journey.purpose = purpose
 
-        db.commit()
+        await db.commit()
         return {"message": "Purpose verified successfully"}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {str(e)}",
+        )
+
+
+@router.patch(
+    "/trip_modes/refresh",
+    dependencies=[Depends(require_internal_token)],
+    include_in_schema=False,
+)
+async def refresh_trip_modes(db: db_dependency):
+    """Reload this worker's trip mode cache after editing trip_mode.
+
+    Other workers pick the change up within MODE_CACHE_TTL seconds.
+    """
+    try:
+        trip_modes.invalidate()
+        modes = await trip_modes.load(db)
+        invalidate_mode_share()
+        return {"modes": modes}
+
+    except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
@@ -1,34 +1,38 @@
-from datetime import date, datetime
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Annotated, List
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, select
+import json
+import os
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pydantic import ValidationError
+from typing import Annotated, Any, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
 
 
 from database import get_database
-from baseModel import UserBase, ComplaintBase, TripRequestBase, JourneyBase
+from baseModel import UserBase, ComplaintBase, TripRequestBase
 from models import (
     User,
     Complaint,
-    Trip,
-    LocationPoints,
-    TripMode,
     DataCollector,
-    Journey,
-)
-from Tools.helperMethods import (
-    get_location_name,
-    distance_travelled,
-    travel_mode_interprter,
 )
+from Tools.geoCell import geocell
+from Tools.helperMethods import TRIP_CLASSIFIERS
+from Tools.heatmap import lock_heatmap_sources
+from Tools.modeShare import invalidate_mode_share
+from Tools.odMatrix import invalidate_od_matrix
+from Tools.timestamps import Timestamp
+from Tools.tripBuilder import build_journey
+from Tools.tripJobs import enqueue_trip_job
 
 
-db_dependency = Annotated[Session, Depends(get_database)]
+db_dependency = Annotated[AsyncSession, Depends(get_database)]
 router = APIRouter(prefix="/create", tags=["create"])
 
+MAX_BULK_POINTS = int(os.getenv("MAX_BULK_POINTS", "5000"))
+
 
 @router.post("/user")
-def create_user(user: UserBase, db: db_dependency):
+async def create_user(user: UserBase, db: db_dependency):
     db_user = User(
         age=user.age,
         gender=user.gender,
@@ -36,13 +40,13 @@ def create_user(user: UserBase, db: db_dependency):
 
     try:
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
 
         return {"user_id": db_user.id}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
@@ -50,128 +54,67 @@ def create_user(user: UserBase, db: db_dependency):
 
 
 @router.post("/complaint")
-def raise_complaint(complaint: ComplaintBase, db: db_dependency):
+async def raise_complaint(complaint: ComplaintBase, db: db_dependency):
     userComplaint = Complaint(
         user_id=complaint.user_id,
         location_lon=complaint.location_lon,
         location_lat=complaint.location_lat,
+        geocell=geocell(complaint.location_lat, complaint.location_lon),
         description=complaint.description,
         category=complaint.category,
         status=complaint.status,
     )
 
     try:
+        await lock_heatmap_sources(db)
         db.add(userComplaint)
-        db.commit()
-        db.refresh(userComplaint)
+        await db.commit()
+        await db.refresh(userComplaint)
 
         return {"message": "Complaint stored successfully."}
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
         )
 
 
-@router.post("/trip", response_model=JourneyBase)
-def add_trip(user_id: int, timestamp: str, db: db_dependency):
-    try:
-        stmt = (
-            select(DataCollector)
-            .where(
-                and_(
-                    DataCollector.user_id == user_id,
-                    DataCollector.timestamp <= datetime.fromisoformat(timestamp),
-                    DataCollector.is_used.is_(False),
-                )
-            )
-            .order_by(DataCollector.timestamp)
-        )
-        tripsData = db.execute(stmt).scalars().all()
-        trips = travel_mode_interprter(tripsData)
-
-        journey = Journey(
-            origin=get_location_name(
-                trips[0]["origin"]["latitude"], trips[0]["origin"]["longitude"]
-            ),
-            destination=get_location_name(
-                trips[-1]["destination"]["latitude"],
-                trips[-1]["destination"]["longitude"],
-            ),
-            user_id=user_id,
-            start_time=datetime.fromisoformat(trips[0]["origin"]["timestamp"]),
-            end_time=datetime.fromisoformat(trips[-1]["destination"]["timestamp"]),
+@router.post("/trip", status_code=status.HTTP_202_ACCEPTED)
+async def add_trip(
+    user_id: int,
+    timestamp: Timestamp,
+    db: db_dependency,
+    response: Response,
+    classifier: Optional[str] = None,
+    wait: bool = False,
+):
+    """Queue trip inference for the user's points up to ``timestamp``.
+
+    Returns the job id to poll at /get/trip/job/{job_id}. With ``wait``
+    the journey is built within the request and returned directly.
+    """
+    if classifier is not None and classifier.lower() not in TRIP_CLASSIFIERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown classifier {classifier!r}; "
+            f"expected one of {', '.join(TRIP_CLASSIFIERS)}",
         )
-        db.add(journey)
-        db.commit()
-        db.refresh(journey)
-
-        for trip in trips:
-
-            originPoints = LocationPoints(
-                latitude=trip["origin"]["latitude"],
-                longitude=trip["origin"]["longitude"],
-                location_name=get_location_name(
-                    trip["origin"]["latitude"], trip["origin"]["longitude"]
-                ),
-            )
-            destinationPoints = LocationPoints(
-                latitude=trip["destination"]["latitude"],
-                longitude=trip["destination"]["longitude"],
-                location_name=get_location_name(
-                    trip["destination"]["latitude"], trip["destination"]["longitude"]
-                ),
-            )
-
-            db.add(originPoints)
-            db.add(destinationPoints)
-            db.commit()
-            db.refresh(originPoints)
-            db.refresh(destinationPoints)
-
-            stmt = select(TripMode).where(TripMode.mode_name == trip["mode"].upper())
-            mode = db.execute(stmt).scalars().first()
-
-            _trip = Trip(
-                user_id=user_id,
-                mode_id=mode.id,
-                journey_id=journey.id,
-                origin_location_id=originPoints.id,
-                destination_location_id=destinationPoints.id,
-                start_time=datetime.fromisoformat(trip["origin"]["timestamp"]),
-                end_time=datetime.fromisoformat(trip["destination"]["timestamp"]),
-                distance_travelled=distance_travelled(
-                    originLatitude=originPoints.latitude,
-                    originLongitude=originPoints.longitude,
-                    destLatitude=destinationPoints.latitude,
-                    destLongitude=destinationPoints.longitude,
-                ),
-            )
-
-            db.add(_trip)
-            db.commit()
-            db.refresh(_trip)
-
-            for tripData in tripsData:
-                tripData.is_used = True
-                db.add(tripData)
-
-            db.commit()
+    try:
+        if not wait:
+            job = await enqueue_trip_job(db, user_id, timestamp, classifier)
+            return {"job_id": job.id, "status": job.status}
 
-        return JourneyBase(
-            id=journey.id,
-            origin=journey.origin,
-            destination=journey.destination,
-            start_time=str(journey.start_time),
-            end_time=str(journey.end_time),
-            purpose=journey.purpose,
-            is_verified_by_user=journey.is_verified_by_user,
-        )
+        journey = await build_journey(db, user_id, timestamp, classifier)
+        await db.commit()
+        invalidate_mode_share()
+        invalidate_od_matrix()
+        response.status_code = status.HTTP_200_OK
+        return journey
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
@@ -179,20 +122,103 @@ def add_trip(user_id: int, timestamp: str, db: db_dependency):
 
 
 @router.post("/api_required_data")
-def create_api_required_data(tripData: TripRequestBase, db: db_dependency):
+async def create_api_required_data(tripData: TripRequestBase, db: db_dependency):
     data = DataCollector(
         user_id=tripData.user_id,
         latitude=tripData.latitude,
         longitude=tripData.longitude,
         speed=tripData.speed,
-        timestamp=datetime.fromisoformat(tripData.timestamp),
+        timestamp=tripData.timestamp,
     )
     try:
         db.add(data)
-        db.commit()
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}",
         )
+
+
+def _parse_bulk_points(body: bytes, content_type: str) -> List[Any]:
+    """Split a bulk ingest body into raw point objects.
+
+    Accepts either a JSON array or NDJSON (one JSON object per line).
+    Lines that are not valid JSON are passed through as strings so they
+    are counted as rejected instead of failing the whole batch.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = []
+        for line in body.decode("utf-8").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(line)
+        return items
+
+    payload = json.loads(body or b"[]")
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of points")
+    return payload
+
+
+@router.post("/api_required_data/bulk")
+async def create_api_required_data_bulk(request: Request, db: db_dependency):
+    """Store a batch of GPS points with one multi-row insert.
+
+    The body is a JSON array of ``TripRequestBase`` objects, or NDJSON when
+    sent with ``Content-Type: application/x-ndjson``. Invalid points are
+    skipped and reported; valid ones are written in a single transaction.
+    """
+    try:
+        items = _parse_bulk_points(
+            await request.body(), request.headers.get("content-type", "")
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid bulk payload: {str(e)}",
+        )
+
+    if len(items) > MAX_BULK_POINTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may contain at most {MAX_BULK_POINTS} points",
+        )
+
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            point = TripRequestBase.model_validate(item)
+            rows.append(
+                {
+                    "user_id": point.user_id,
+                    "latitude": point.latitude,
+                    "longitude": point.longitude,
+                    "speed": point.speed,
+                    "timestamp": point.timestamp,
+                    "is_used": False,
+                }
+            )
+        except (ValidationError, ValueError, TypeError) as e:
+            errors.append({"index": index, "error": str(e)})
+
+    if rows:
+        try:
+            # executemany on a Core insert is batched into multi-row
+            # INSERT ... VALUES statements, so the whole batch costs one commit.
+            await db.execute(insert(DataCollector), rows)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"An error occurred: {str(e)}",
+            )
+
+    return {"accepted": len(rows), "rejected": len(errors), "errors": errors}
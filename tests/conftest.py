@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+# The tests run from the repository root without a database; the engines in
+# database.py are created lazily and never connect.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_database  # noqa: E402
+from main import app  # noqa: E402
+
+
+class FakeSession:
+    """Stands in for the request's AsyncSession and records what it is given.
+
+    Successive ``execute`` calls return the items queued in ``results``.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.executed = []
+        self.commits = 0
+        self.results = []
+
+    def add(self, instance):
+        self.added.append(instance)
+
+    async def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+        return self.results.pop(0) if self.results else None
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db():
+    session = FakeSession()
+
+    async def override():
+        yield session
+
+    app.dependency_overrides[get_database] = override
+    yield session
+    app.dependency_overrides.pop(get_database, None)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+def _natpac_rows(count):
+    """Rows shaped like _natpac_trips_stmt() results."""
+    start = datetime(2025, 1, 6, 8)
+    return [
+        (
+            trip_id,
+            trip_id % 7 + 1,
+            "F",
+            30,
+            trip_id // 3 + 1,
+            10.0,
+            76.0,
+            "Origin",
+            10.1,
+            76.1,
+            "Destination",
+            start + timedelta(minutes=trip_id),
+            start + timedelta(minutes=trip_id + 20),
+            "BUS",
+            4.5,
+            0,
+            False,
+        )
+        for trip_id in range(1, count + 1)
+    ]
+
+
+def test_trips_is_one_statement_however_many_trips(fake_db):
+    fake_db.results.append(_natpac_rows(250))
+
+    response = client.get("/get/trips")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 250
+    assert len(fake_db.executed) == 1
+    assert response.json()[0] == {
+        "trip_id": 1,
+        "user_id": 2,
+        "user_gender": "F",
+        "user_age": 30,
+        "journey_id": 1,
+        "origin": {"latitude": 10.0, "longitude": 76.0, "name": "Origin"},
+        "destination": {"latitude": 10.1, "longitude": 76.1, "name": "Destination"},
+        "start_time": "2025-01-06 08:01:00",
+        "end_time": "2025-01-06 08:21:00",
+        "mode": "BUS",
+        "distance_travelled": 4.5,
+        "co_travellers": 0,
+        "is_verified_by_user": False,
+    }
@@ -0,0 +1,35 @@
+import asyncio
+
+from sqlalchemy.dialects import postgresql
+
+from Tools.odMatrix import OD_UPSERT_MAX_ROWS, _add_flows
+from tests.conftest import FakeSession
+
+ASYNCPG_MAX_PARAMETERS = 32767
+
+
+def test_add_flows_splits_upserts_under_the_parameter_limit():
+    count = 2 * OD_UPSERT_MAX_ROWS + 100
+    flows = {
+        (zone, zone + 1, zone % 5 + 1, zone % 24): [1, 2.5] for zone in range(count)
+    }
+    db = FakeSession()
+
+    asyncio.run(_add_flows(db, flows))
+
+    assert len(db.executed) == 3
+    written = []
+    for statement, _ in db.executed:
+        params = statement.compile(dialect=postgresql.dialect()).params
+        assert len(params) <= ASYNCPG_MAX_PARAMETERS
+        written.extend(
+            params[key] for key in params if key.startswith("origin_zone")
+        )
+    # Every flow is written once, in key order across the chunks.
+    assert written == sorted(range(count))
+
+
+def test_add_flows_writes_nothing_without_flows():
+    db = FakeSession()
+    asyncio.run(_add_flows(db, {}))
+    assert db.executed == []
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import pytest
+
+from Tools.pagination import decode_cursor, encode_cursor
+from Tools.timestamps import parse_timestamp
+
+
+def test_parse_timestamp_converts_offsets_to_naive_utc():
+    assert parse_timestamp("2025-01-06T09:00:00+05:30") == datetime(2025, 1, 6, 3, 30)
+    assert parse_timestamp("2025-01-06T09:00:00Z") == datetime(2025, 1, 6, 9, 0)
+    assert parse_timestamp("2025-01-06T09:00:00") == datetime(2025, 1, 6, 9, 0)
+
+
+@pytest.mark.parametrize("value", ["", "yesterday", 1736154000, None])
+def test_parse_timestamp_rejects_non_iso_values(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_cursor_datetimes_with_offsets_come_back_naive_utc():
+    token = encode_cursor(datetime.fromisoformat("2025-01-06T09:00:00+05:30"), 7)
+    assert decode_cursor(token, datetime, int) == [datetime(2025, 1, 6, 3, 30), 7]
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from main import app
+
+# Without ``with`` the lifespan (cache warm-up, background workers) does not
+# run, so these requests never reach the database.
+client = TestClient(app)
+
+
+def test_add_trip_rejects_unknown_classifier():
+    response = client.post(
+        "/create/trip",
+        params={"user_id": 1, "timestamp": "2025-01-06T09:00:00", "classifier": "gpt"},
+    )
+    assert response.status_code == 400
+    assert "gpt" in response.json()["detail"]
+
+
+def test_api_required_data_stores_offsets_as_naive_utc(fake_db):
+    response = client.post(
+        "/create/api_required_data",
+        json={
+            "user_id": 1,
+            "latitude": 10.0,
+            "longitude": 76.0,
+            "speed": 4.2,
+            "timestamp": "2025-01-06T09:00:00+05:30",
+        },
+    )
+    assert response.status_code == 200
+    assert fake_db.added[0].timestamp == datetime(2025, 1, 6, 3, 30)
+
+
+def test_bulk_ingest_converts_offsets_and_rejects_bad_rows(fake_db):
+    point = {"user_id": 1, "latitude": 10.0, "longitude": 76.0, "speed": 4.2}
+    response = client.post(
+        "/create/api_required_data/bulk",
+        json=[
+            {**point, "timestamp": "2025-01-06T09:00:00Z"},
+            {**point, "timestamp": "2025-01-06T09:00:10+05:30"},
+            {**point, "timestamp": "2025-01-06T09:00:20"},
+            {**point, "timestamp": "yesterday"},
+        ],
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["rejected"]) == (3, 1)
+    assert body["errors"][0]["index"] == 3
+    _, rows = fake_db.executed[0]
+    assert [row["timestamp"] for row in rows] == [
+        datetime(2025, 1, 6, 9, 0, 0),
+        datetime(2025, 1, 6, 3, 30, 10),
+        datetime(2025, 1, 6, 9, 0, 20),
+    ]
+    assert all(row["timestamp"].tzinfo is None for row in rows)
+
+
+def test_add_trip_rejects_invalid_timestamp():
+    response = client.post(
+        "/create/trip", params={"user_id": 1, "timestamp": "not a time"}
+    )
+    assert response.status_code == 422
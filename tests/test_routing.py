@@ -0,0 +1,62 @@
+from urllib.parse import urlsplit
+
+import pytest
+
+from Tools import helperMethods
+from Tools.helperMethods import distance_travelled_batch, haversine_km
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def osrm(monkeypatch):
+    """Stub OSRM: every leg is 1.25 times its haversine length."""
+    calls = []
+
+    def fake_retry_get(url, params=None, **kwargs):
+        calls.append(params)
+        coordinates = urlsplit(url).path.rsplit("/", 1)[-1].split(";")
+        points = [tuple(map(float, c.split(",")))[::-1] for c in coordinates]
+        legs = [
+            {"distance": haversine_km(*a, *b) * 1250.0}
+            for a, b in zip(points, points[1:])
+        ]
+        return FakeResponse({"code": "Ok", "routes": [{"legs": legs}]})
+
+    monkeypatch.setattr(helperMethods, "_retry_get", fake_retry_get)
+    helperMethods.route_cache.invalidate()
+    yield calls
+    helperMethods.route_cache.invalidate()
+
+
+LEGS = [
+    (10.0, 76.0, 10.01, 76.02),
+    (10.05, 76.1, 10.0, 76.0),
+    (9.9, 76.3, 9.95, 76.25),
+]
+
+
+def test_batch_legs_match_single_leg_requests(osrm):
+    batch = distance_travelled_batch(LEGS)
+    assert len(osrm) == 1
+
+    single = []
+    for leg in LEGS:
+        helperMethods.route_cache.invalidate()
+        single.extend(distance_travelled_batch([leg]))
+
+    assert batch == pytest.approx(single)
+    assert batch == pytest.approx([haversine_km(*leg) * 1.25 for leg in LEGS])
+
+
+def test_batch_lets_routes_turn_at_waypoints(osrm):
+    distance_travelled_batch(LEGS)
+    assert osrm[0]["continue_straight"] == "false"